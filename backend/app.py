@@ -1,18 +1,34 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g, redirect, abort
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
+import base64
 import time
+import traceback
+from datetime import datetime, timedelta, timezone
 import atexit
-import signal
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
-from transcribe_audio import transcribe_audio
-from tts import text_to_speech, translate_text
-from gemini_api import get_character_response
+from transcribe_audio import transcribe_pcm
+from audio_convert import decode_to_pcm, pcm_to_wav, pcm_duration, trim_silence, AudioConversionError
+from tts import (text_to_speech, stream_text_to_speech, join_sentence_audio, translate_text, tts_cache, tts_cache_key,
+                 validate_characters)
+from gemini_api import (get_character_response, stream_character_response, estimate_tokens,
+                        recent_turns, turns_to_summarize, summarize_turns, CHARACTERS)
+from live_transcription import start_session, get_session, end_session
+from retention import RetentionSweeper, SHARED_AUDIO_TOUCH_INTERVAL
+from conversation_clear import start_clear_job, get_job
+from write_behind import TurnWriter
+from audio_delivery import AudioDelivery, ARCHIVE_RECORDINGS, AUDIO_NAME_PATTERN, AUDIO_PREFIX
+from sessions import (SESSION_COOKIE, SESSION_MAX_AGE, TRUSTED_PROXIES, new_session_id, valid_session_id,
+                      conversation_id, conversation_ref, messages_ref, recordings_prefix)
 from firebase_creds import cred
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
+if TRUSTED_PROXIES:
+    # Client address and scheme from the load balancer's X-Forwarded-For / X-Forwarded-Proto
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
 
 load_dotenv()
 
@@ -24,43 +40,32 @@ firebase_admin.initialize_app(cred, {'storageBucket': firebase_storage_bucket})
 db = firestore.client()
 bucket = storage.bucket()
 
-UPLOAD_FOLDER = "static/audio"
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-def clear_collection(ip_address, character):
-    collection_name = f"{ip_address.replace('.', '_')}_{character}"
-    print(f"Clearing Firestore '{collection_name}' collection...")
-    docs = db.collection(collection_name).stream()
-    for doc in docs:
-        doc.reference.delete()
-
-def clear_storage(ip_address, character):
-    prefix = f"audio/{ip_address.replace('.', '_')}_{character}/"
-    print(f"Clearing Firebase Storage '{prefix}' folder...")
-    blobs = bucket.list_blobs(prefix=prefix)
-    for blob in blobs:
-        blob.delete()
-
-def cleanup_all():
-    print("Cleaning up all Firebase data...")
-    collections = db.collections()
-    for collection in collections:
-        for doc in collection.stream():
-            doc.reference.delete()
-    blobs = bucket.list_blobs(prefix="audio/")
-    for blob in blobs:
-        blob.delete()
-
-cleanup_all()
-atexit.register(cleanup_all)
-
-def handle_shutdown(signal, frame):
-    print("Received SIGINT (Ctrl+C). Performing cleanup...")
-    cleanup_all()
-    exit(0)
-
-signal.signal(signal.SIGINT, handle_shutdown)
+# Independent stages of a request (e.g. Firestore reads) run concurrently here
+stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv('STAGE_WORKERS', '16')),
+                                    thread_name_prefix='stage')
+# Work that can finish after the response has been sent (e.g. summary refreshes, clear jobs, uploads)
+background_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BACKGROUND_WORKERS', '4')),
+                                         thread_name_prefix='background')
+audio_delivery = AudioDelivery(bucket, background_executor)
+
+# Transcribe microphone audio while it is recorded (see /live_audio) instead of after upload
+LIVE_TRANSCRIPTION = os.getenv('LIVE_TRANSCRIPTION', '1') != '0'
+# Let the browser end a recording after a pause in speech and skip uploading silent clips
+CLIENT_VAD = os.getenv('CLIENT_VAD', '0') != '0'
+# Conversations are fetched in pages, newest first, addressed by timestamp cursors
+CONVERSATION_PAGE_SIZE = int(os.getenv('CONVERSATION_PAGE_SIZE', '20'))
+MAX_CONVERSATION_PAGE_SIZE = 100
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Turns are written behind the response, journaled locally until Firestore has them
+turn_writer = TurnWriter(db)
+turn_writer.start()
+atexit.register(turn_writer.stop)
+
+# Expired conversations and audio are deleted in the background, never on the startup or shutdown path
+retention_sweeper = RetentionSweeper(db, bucket)
+retention_sweeper.start()
+atexit.register(retention_sweeper.stop)
 
 character_data = {
     'victor': {
@@ -85,45 +90,349 @@ character_data = {
     }
 }
 
+# Every character the app serves must have voices of its own, not silently Jax's
+validate_characters(set(character_data) | set(CHARACTERS))
+
+@app.before_request
+def load_session():
+    """Identify the browser by its session cookie, issuing a new id to browsers without one"""
+    session_id = request.cookies.get(SESSION_COOKIE)
+    g.new_session = not valid_session_id(session_id)
+    g.session_id = new_session_id() if g.new_session else session_id
+
+@app.after_request
+def store_session(response):
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=SESSION_MAX_AGE,
+                            httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy"}), 200
+    # Turns are stored behind the response, so failing writes would otherwise go unnoticed
+    turn_writes = turn_writer.status()
+    return jsonify({"status": "healthy" if turn_writes['status'] == 'ok' else "degraded",
+                    "turn_writes": turn_writes}), 200
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-def get_conversation(ip_address, character):
-    collection_name = f"{ip_address.replace('.', '_')}_{character}"
-    conversation_ref = db.collection(collection_name).order_by('timestamp')
-    return [doc.to_dict() for doc in conversation_ref.stream()]
+def to_cursor(timestamp):
+    """Exact microseconds since the epoch, used as an opaque pagination cursor"""
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+def from_cursor(cursor):
+    return EPOCH + timedelta(microseconds=int(cursor))
+
+def serialize_message(doc_id, data):
+    """A stored turn as clients get it: JSON-safe, with its id and pagination cursor"""
+    message = dict(data)
+    message['id'] = doc_id
+    message['cursor'] = to_cursor(message['timestamp'])
+    message['timestamp'] = message['timestamp'].isoformat()
+    return message
+
+def get_conversation(conversation_id, limit=CONVERSATION_PAGE_SIZE, start_after=None, since=None):
+    """
+    Return (messages, has_more) for one page of a conversation, oldest first.
+
+    since: messages newer than this cursor (has_more means newer ones remain)
+    start_after: the `limit` messages just older than this cursor, for back-scroll
+    otherwise: the latest `limit` messages (has_more means older ones remain)
+    """
+    conversation = conversation_ref(db, conversation_id).get()
+    cleared_at = (conversation.to_dict() or {}).get('cleared_through') if conversation.exists else None
+    messages = messages_ref(db, conversation_id)
+    # Turns still in the write-behind queue are merged in, so a client sees its own writes
+    pending = [(turn_id, turn) for turn_id, turn in turn_writer.pending_turns(conversation_id)
+               if not cleared_at or turn['timestamp'] > cleared_at]
+    if since is not None:
+        start = from_cursor(since)
+        if cleared_at and cleared_at > start:
+            start = cleared_at
+        query = messages.order_by('timestamp').start_after({'timestamp': start})
+        found = {doc.id: doc.to_dict() for doc in query.limit(limit + 1).stream()}
+        found.update((turn_id, turn) for turn_id, turn in pending if turn['timestamp'] > start)
+        docs = sorted(found.items(), key=lambda item: item[1]['timestamp'])
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+    else:
+        query = messages.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        end = None
+        if start_after is not None:
+            end = from_cursor(start_after)
+            query = query.start_after({'timestamp': end})
+        if cleared_at:
+            query = query.end_before({'timestamp': cleared_at})
+        found = {doc.id: doc.to_dict() for doc in query.limit(limit + 1).stream()}
+        found.update((turn_id, turn) for turn_id, turn in pending if end is None or turn['timestamp'] < end)
+        docs = sorted(found.items(), key=lambda item: item[1]['timestamp'], reverse=True)
+        has_more = len(docs) > limit
+        docs = docs[:limit][::-1]
+    return [serialize_message(doc_id, data) for doc_id, data in docs], has_more
 
 @app.route('/<character>')
 def character_chat(character):
     if character not in character_data:
         return "Character not found", 404
-    ip_address = request.remote_addr
-    conversation = get_conversation(ip_address, character)
+    conversation, has_more = get_conversation(conversation_id(g.session_id, character))
     return render_template('character_template.html',
                          character_id=character,
                          character_name=character_data[character]['name'],
                          character_title=character_data[character]['title'],
                          character_description=character_data[character]['description'],
                          conversation=conversation,
-                         ip_address=ip_address)
+                         has_more=has_more,
+                         live_transcription=LIVE_TRANSCRIPTION,
+                         client_vad=CLIENT_VAD)
+
+@app.route('/conversation/<character>')
+def conversation_page(character):
+    if character not in character_data:
+        return jsonify({"error": "Character not found"}), 404
+    try:
+        limit = min(int(request.args.get('limit', CONVERSATION_PAGE_SIZE)), MAX_CONVERSATION_PAGE_SIZE)
+        since = request.args.get('since', type=int)
+        start_after = request.args.get('start_after', type=int)
+        if limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+        messages, has_more = get_conversation(conversation_id(g.session_id, character), limit,
+                                              start_after=start_after, since=since)
+        return jsonify({"messages": messages, "has_more": has_more})
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    except Exception as e:
+        print(f"Error in conversation_page: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def wants_stream():
+    # Streaming is opt-in so existing clients keep getting a single JSON blob
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def collect_stages(stages):
+    """Run every stage and merge their payloads into the classic JSON response."""
+    result = {}
+    try:
+        for event, payload in stages:
+            if event == 'error':
+                return jsonify(payload), 500
+            result.update(payload)
+    finally:
+        stages.close()
+    return jsonify(result)
+
+def stream_stages(stages):
+    """Emit each stage as one NDJSON line as soon as it completes."""
+    def generate():
+        try:
+            for event, payload in stages:
+                # The app's provider, like jsonify in collect_stages, so payloads may hold datetimes
+                yield app.json.dumps({"event": event, **payload}) + "\n"
+        except Exception as e:
+            print(f"Error while streaming response: {str(e)}")
+            print(traceback.format_exc())
+            yield app.json.dumps({"event": "error", "error": str(e)}) + "\n"
+        finally:
+            stages.close()
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def load_context(conversation_id):
+    """
+    Return (summary, turns): the stored running summary (or {}) and the turns it
+    does not cover yet, oldest first. Turns from before the last clear are left out.
+    """
+    conversation = conversation_ref(db, conversation_id).get()
+    data = conversation.to_dict() if conversation.exists else {}
+    summary = data.get('summary') or {}
+    start = summary.get('summarized_through')
+    cleared_at = data.get('cleared_through')
+    if cleared_at and (start is None or start <= cleared_at):
+        # A summary written by a refresh that finished after the clear
+        summary = {}
+        start = cleared_at
+    query = messages_ref(db, conversation_id).order_by('timestamp')
+    if start:
+        query = query.start_after({'timestamp': start})
+    turns = {doc.id: doc.to_dict() for doc in query.stream()}
+    # Including turns the write-behind queue hasn't committed yet
+    turns.update((turn_id, turn) for turn_id, turn in turn_writer.pending_turns(conversation_id)
+                 if not start or turn['timestamp'] > start)
+    return summary, sorted(turns.values(), key=lambda turn: turn['timestamp'])
+
+def refresh_summary(conversation_id, character, summary, turns):
+    """Roll the oldest unsummarized turns into the stored summary once they exceed the token budget"""
+    try:
+        old_turns = turns_to_summarize(turns)
+        if not old_turns:
+            return
+        new_summary = summarize_turns(character, summary.get('summary'), old_turns)
+        if not new_summary:
+            return
+        conversation_ref(db, conversation_id).set({'summary': {
+            'summary': new_summary,
+            'token_count': estimate_tokens(new_summary),
+            'summarized_through': old_turns[-1]['timestamp'],
+            'summarized_turns': summary.get('summarized_turns', 0) + len(old_turns)
+        }}, merge=True)
+        print(f"Summarized {len(old_turns)} older turns for {conversation_id}")
+    except Exception as e:
+        print(f"Error refreshing conversation summary: {str(e)}")
+
+def archive_recording(blob_path, render):
+    """
+    URL of the user's recording, archived in the background from render()'s
+    WAV bytes, or None when ARCHIVE_RECORDINGS is off (the browser has its copy)
+    """
+    if not ARCHIVE_RECORDINGS:
+        return None
+    return audio_delivery.publish_later(blob_path, render, 'audio/wav')
+
+def reply_stages(conversation_id, character, selected_language, user_input, timestamp,
+                 recorded_audio_url=None, incremental=False):
+    """
+    Generate the character's reply to user_input, yielding (event, payload)
+    pairs as each stage finishes: the reply text, its audio and the
+    stored message. With incremental=True the audio is also yielded
+    sentence by sentence as base64 MP3 'audio_chunk' events, and English
+    replies are yielded as 'response_delta' events while they are generated.
+    recorded_audio_url is where the user's recording is archived, if it is.
+    """
+    target_language = selected_language.split("-")[0]
+    # The turn's id is assigned locally and sent with the reply text, so the client knows
+    # the turn before turn_writer makes it readable and never renders it twice
+    turn_ref = messages_ref(db, conversation_id).document()
+    # Reading the history doesn't depend on the translation, so run both at once
+    context_future = stage_executor.submit(load_context, conversation_id)
+
+    # The user's language is known, so English turns skip the Translation API entirely
+    user_input_en = translate_text(user_input, "en", source_language=target_language)
+    summary, turns = context_future.result()
+    history = recent_turns(turns)
+    if incremental and target_language == "en":
+        # Nothing to translate afterwards, so show the text as the model writes it
+        deltas = []
+        try:
+            for delta in stream_character_response(user_input_en, "en-US", character,
+                                                    history=history, summary=summary.get('summary')):
+                deltas.append(delta)
+                yield 'response_delta', {"text": delta, "character": character, "message_id": turn_ref.id}
+        except Exception as e:
+            yield 'error', {"error": f"Failed to get response: {str(e)}"}
+            return
+        response_en = "".join(deltas)
+    else:
+        response_en = get_character_response(user_input_en, "en-US", character,
+                                             history=history, summary=summary.get('summary'))
+        if "Error" in response_en:
+            yield 'error', {"error": f"Failed to get response: {response_en}"}
+            return
+
+    response = translate_text(response_en, target_language, source_language="en")
+    yield 'response', {"response": response, "character": character, "message_id": turn_ref.id}
+
+    # Identical lines in the same voice are content-addressed, so a line that was
+    # already synthesized and published is served from its existing URL
+    cache_key = tts_cache_key(response, selected_language, character,
+                              variant="incremental" if incremental else "full")
+    tts_blob_path = f"{AUDIO_PREFIX}tts/{cache_key}.mp3"
+    synthesized_audio_url = tts_cache.get_url(cache_key)
+    if synthesized_audio_url:
+        print(f"Reusing synthesized audio for this line: {synthesized_audio_url}")
+        # This turn links to the blob too, so it must outlive the turn's conversation
+        if tts_cache.refresh_url(cache_key, SHARED_AUDIO_TOUCH_INTERVAL.total_seconds()):
+            audio_delivery.touch_later(tts_blob_path)
+    else:
+        if incremental:
+            chunks = []
+            for index, chunk in enumerate(stream_text_to_speech(response, selected_language, character)):
+                chunks.append(chunk)
+                yield 'audio_chunk', {"index": index, "audio": base64.b64encode(chunk).decode('ascii')}
+            synthesized_audio = join_sentence_audio(chunks)
+            # Cached under its own key so /audio/ can serve the joined reply
+            tts_cache.put(cache_key, synthesized_audio)
+            # The client already played the chunks and only needs the URL for replays, so
+            # the upload runs after the turn in every mode. The URL is remembered for reuse
+            # once the blob exists.
+            synthesized_audio_url = audio_delivery.publish_later(
+                tts_blob_path, lambda: synthesized_audio, 'audio/mpeg',
+                on_uploaded=lambda url: tts_cache.put_url(cache_key, url))
+        else:
+            # Without chunks the client plays this URL straight away, so outside cache
+            # mode the blob has to be uploaded first
+            synthesized_audio = text_to_speech(response, selected_language, character)
+            synthesized_audio_url = audio_delivery.publish(tts_blob_path, synthesized_audio, 'audio/mpeg')
+            tts_cache.put_url(cache_key, synthesized_audio_url)
+    yield 'audio', {"synthesized_audio_url": synthesized_audio_url}
+
+    # The turn is only queued here; turn_writer stores it (with the conversation's
+    # indexed last_active) after the response
+    turn = {
+        'user_input_id': f"user_input_{timestamp}",
+        'timestamp': datetime.now(timezone.utc),
+        'user_input': user_input,
+        'response': response,
+        'user_input_en': user_input_en,
+        'response_en': response_en,
+        'token_count': estimate_tokens(user_input_en + response_en),
+        'character': character,
+        'selected_language': selected_language,
+        'recorded_audio_url': recorded_audio_url,
+        'synthesized_audio_url': synthesized_audio_url
+    }
+    turn_writer.enqueue(conversation_id, turn_ref.id, turn)
+    background_executor.submit(refresh_summary, conversation_id, character, summary, turns + [turn])
+    yield 'message', {"message": serialize_message(turn_ref.id, turn)}
+
+def audio_stages(conversation_id, character, selected_language, recording, timestamp,
+                 incremental=False):
+    """Transcribe an uploaded recording (its bytes), then continue with reply_stages."""
+    try:
+        # Decode the WebM upload into 16 kHz mono PCM, once
+        pcm_audio = decode_to_pcm(recording)
+    except AudioConversionError as e:
+        print(f"Audio conversion error: {str(e)}")
+        yield 'error', {"error": "Audio conversion failed"}
+        return
+    recorded_seconds = pcm_duration(pcm_audio)
+    # Silence costs Storage bytes and billed Speech-to-Text seconds, so only the speech goes on
+    pcm_audio = trim_silence(pcm_audio)
+    if not pcm_audio:
+        print(f"No speech in {recorded_seconds:.2f}s of recorded audio")
+        yield 'error', {"error": "No speech detected"}
+        return
+    print(f"Decoded {recorded_seconds:.2f}s of recorded audio, {pcm_duration(pcm_audio):.2f}s of it speech")
+
+    # The URL is known up front; the WAV is encoded and archived in the background
+    recorded_audio_url = archive_recording(f"{recordings_prefix(conversation_id)}recorded_audio_{timestamp}.wav",
+                                           lambda: pcm_to_wav(pcm_audio))
+    transcript = transcribe_pcm(pcm_audio, language=selected_language)
+
+    if not transcript:
+        yield 'error', {"error": "Transcription failed or no speech detected"}
+        return
+    print(f"Transcription successful: '{transcript}'")
+    yield 'transcript', {
+        "transcript": transcript,
+        "selected_language": selected_language,
+        "recorded_audio_url": recorded_audio_url
+    }
+
+    yield from reply_stages(conversation_id, character, selected_language, transcript, timestamp,
+                            recorded_audio_url=recorded_audio_url, incremental=incremental)
 
 @app.route('/process_audio', methods=['POST'])
 def process_audio():
-    synthesized_audio_path = None
-    recorded_audio_path = None
-    converted_audio_path = None
     try:
-        ip_address = request.remote_addr.replace('.', '_')
         character = request.form.get('character')
         selected_language = request.form.get('language', 'en-US')
         
-        if not character:
-            return jsonify({"error": "No character specified"}), 400
+        # The character is part of document ids and Storage paths, so only known ones are accepted
+        if character not in character_data:
+            return jsonify({"error": "No valid character specified"}), 400
         if not selected_language:
             return jsonify({"error": "No language selected"}), 400
         if 'audio' not in request.files:
@@ -131,176 +440,183 @@ def process_audio():
 
         audio_file = request.files['audio']
         timestamp = str(time.time_ns())
-        recorded_audio_path = f"{UPLOAD_FOLDER}/recorded_audio_{timestamp}.webm"
-        audio_file.save(recorded_audio_path)
-        print(f"Received and saved audio to {recorded_audio_path}")
-
-        # Convert WebM to WAV using ffmpeg
-        converted_audio_path = f"{UPLOAD_FOLDER}/converted_audio_{timestamp}.wav"
-        subprocess.run([
-            'ffmpeg', '-y', '-i', recorded_audio_path, 
-            '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', 
-            converted_audio_path
-        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print(f"Converted audio to {converted_audio_path}")
-
-        recorded_blob_path = f"audio/{ip_address}_{character}/recorded_audio_{timestamp}.wav"
-        recorded_blob = bucket.blob(recorded_blob_path)
-        recorded_blob.upload_from_filename(converted_audio_path)  # Upload the converted WAV
-        recorded_blob.make_public()
-        recorded_audio_url = recorded_blob.public_url
-        print(f"Uploaded recorded audio to {recorded_blob_path}: {recorded_audio_url}")
-
-        transcript = transcribe_audio(converted_audio_path, language=selected_language)
-        if not transcript:
-            return jsonify({"error": "Transcription failed or no speech detected"}), 500
-        print(f"Transcription successful: '{transcript}'")
-
-        target_language = selected_language.split("-")[0]
-        transcript_en = translate_text(transcript, "en")
-        response_en = get_character_response(transcript_en, "en-US", character)
-        if "Error" in response_en:
-            return jsonify({"error": f"Failed to get response: {response_en}"}), 500
-
-        response = translate_text(response_en, target_language)
-        synthesized_audio_path = f"{UPLOAD_FOLDER}/synthesized_audio_{timestamp}.mp3"
-        text_to_speech(response, selected_language, character, synthesized_audio_path)
-        print(f"Synthesized audio saved to {synthesized_audio_path}")
-
-        synthesized_blob_path = f"audio/{ip_address}_{character}/synthesized_audio_{timestamp}.mp3"
-        synthesized_blob = bucket.blob(synthesized_blob_path)
-        synthesized_blob.upload_from_filename(synthesized_audio_path)
-        synthesized_blob.make_public()
-        synthesized_audio_url = synthesized_blob.public_url
-        print(f"Uploaded synthesized audio to {synthesized_blob_path}: {synthesized_audio_url}")
-
-        conversation_ref = db.collection(f"{ip_address}_{character}")
-        conversation_ref.add({
-            'user_input_id': f"user_input_{timestamp}",
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'user_input': transcript,
-            'response': response,
-            'character': character,
-            'selected_language': selected_language,
-            'recorded_audio_url': recorded_audio_url,
-            'synthesized_audio_url': synthesized_audio_url
-        })
-
-        conversation = [doc.to_dict() for doc in conversation_ref.order_by('timestamp').stream()]
-        
-        return jsonify({
-            "transcript": transcript,
-            "response": response,
-            "character": character,
-            "selected_language": selected_language,
-            "recorded_audio_url": recorded_audio_url,
-            "synthesized_audio_url": synthesized_audio_url,
-            "conversation": conversation
-        })
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg conversion error: {e.stderr.decode()}")
-        return jsonify({"error": "Audio conversion failed"}), 500
+        print(f"Received audio upload {audio_file.filename}")
+
+        stream = wants_stream()
+        # Read while the request is open: streamed stages run after this view returns,
+        # when Werkzeug has already closed the upload
+        recording = audio_file.read()
+        stages = audio_stages(conversation_id(g.session_id, character), character, selected_language,
+                              recording, timestamp, incremental=stream)
+        if stream:
+            return stream_stages(stages)
+        return collect_stages(stages)
     except Exception as e:
-        import traceback
         print(f"Error in process_audio: {str(e)}")
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
-    finally:
-        if recorded_audio_path and os.path.exists(recorded_audio_path):
-            os.remove(recorded_audio_path)
-        if converted_audio_path and os.path.exists(converted_audio_path):
-            os.remove(converted_audio_path)
-        if synthesized_audio_path and os.path.exists(synthesized_audio_path):
-            os.remove(synthesized_audio_path)
+
+def recording_wav(recording):
+    """Decode a browser recording and trim its silence into WAV bytes, like audio_stages does"""
+    pcm_audio = decode_to_pcm(recording)
+    # The recognizer heard speech, so keep the whole clip if the trim finds none
+    pcm_audio = trim_silence(pcm_audio) or pcm_audio
+    return pcm_to_wav(pcm_audio)
+
+def live_stages(session, timestamp):
+    """
+    Relay a live session's interim transcripts as 'interim_transcript' events,
+    then continue with reply_stages as soon as the final transcript is in.
+    """
+    transcript = None
+    for event, payload in session.results():
+        if event == 'interim':
+            yield 'interim_transcript', payload
+        elif event == 'error':
+            end_session(session.id)
+            yield 'error', payload
+            return
+        else:
+            transcript = payload['transcript']
+    end_session(session.id)
+
+    if not transcript:
+        yield 'error', {"error": "Transcription failed or no speech detected"}
+        return
+    print(f"Live transcription successful: '{transcript}'")
+    # Recognition may end before the browser stops recording; archive what was sent so far
+    recording = bytes(session.recording)
+    recorded_audio_url = archive_recording(
+        f"{recordings_prefix(session.conversation_id)}recorded_audio_{timestamp}.wav",
+        lambda: recording_wav(recording))
+    yield 'transcript', {
+        "transcript": transcript,
+        "selected_language": session.language,
+        "recorded_audio_url": recorded_audio_url
+    }
+
+    yield from reply_stages(session.conversation_id, session.character, session.language, transcript, timestamp,
+                            recorded_audio_url=recorded_audio_url, incremental=True)
+
+@app.route('/live_audio', methods=['POST'])
+def start_live_audio():
+    """Open a live transcription session; audio chunks and events use its id"""
+    data = request.get_json(silent=True) or {}
+    character = data.get('character')
+    selected_language = data.get('language') or 'en-US'
+    if character not in character_data:
+        return jsonify({"error": "No valid character specified"}), 400
+    session = start_session(conversation_id(g.session_id, character), character, selected_language)
+    print(f"Started live transcription {session.id} for {character} in {selected_language}")
+    return jsonify({"session_id": session.id})
+
+@app.route('/live_audio/<session_id>/audio', methods=['POST'])
+def live_audio_chunk(session_id):
+    """Append one chunk of the WebM/Opus recording, in recording order"""
+    session = get_session(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown live session"}), 404
+    session.feed(request.get_data())
+    return ('', 204)
+
+@app.route('/live_audio/<session_id>/end', methods=['POST'])
+def end_live_audio(session_id):
+    """The browser stopped recording"""
+    session = get_session(session_id)
+    if session is not None:
+        session.end()
+    return ('', 204)
+
+@app.route('/live_audio/<session_id>/events')
+def live_audio_events(session_id):
+    """NDJSON stream: interim_transcript events, then the same stages as /process_audio?stream=1"""
+    session = get_session(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown live session"}), 404
+    return stream_stages(live_stages(session, str(time.time_ns())))
+
+@app.route('/audio/<path:name>')
+def audio(name):
+    """
+    Audio by blob name under audio/: recent replies straight from the TTS cache
+    (with Range support), anything else through a short-lived signed URL
+    """
+    match = AUDIO_NAME_PATTERN.fullmatch(name)
+    if match is None:
+        abort(404)
+    tts_key = match.group('tts_key')
+    data = tts_cache.get(tts_key) if tts_key and audio_delivery.mode == 'cache' else None
+    if data is None:
+        return redirect(audio_delivery.signed_url(AUDIO_PREFIX + name))
+    response = Response(data, mimetype='audio/mpeg')
+    # Content-addressed, so the bytes behind this URL never change
+    response.set_etag(tts_key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
 
 @app.route('/process_text', methods=['POST'])
 def process_text():
-    synthesized_audio_path = None
     try:
-        ip_address = request.remote_addr.replace('.', '_')
         data = request.get_json()
         text = data.get('text', '').strip()
         character = data.get('character')
         selected_language = data.get('language', 'en-US')
         
-        if not character:
-            return jsonify({"error": "No character specified"}), 400
+        if character not in character_data:
+            return jsonify({"error": "No valid character specified"}), 400
         if not selected_language:
             return jsonify({"error": "No language selected"}), 400
         if not text:
             return jsonify({"error": "No text provided"}), 400
 
-        full_language_code = selected_language
-        target_language = selected_language.split("-")[0]
-
-        text_en = translate_text(text, "en")
-        response_en = get_character_response(text_en, "en-US", character)
-        if "Error" in response_en:
-            return jsonify({"error": f"Failed to get response: {response_en}"}), 500
-
-        response = translate_text(response_en, target_language)
         timestamp = str(time.time_ns())
-        user_input_id = f"user_input_{timestamp}"
-        synthesized_audio_path = f"{UPLOAD_FOLDER}/synthesized_audio_{timestamp}.mp3"
-        text_to_speech(response, full_language_code, character, synthesized_audio_path)
-        print(f"Synthesized audio saved to {synthesized_audio_path}")
-
-        synthesized_blob_path = f"audio/{ip_address}_{character}/synthesized_audio_{timestamp}.mp3"
-        synthesized_blob = bucket.blob(synthesized_blob_path)
-        synthesized_blob.upload_from_filename(synthesized_audio_path)
-        synthesized_blob.make_public()
-        synthesized_audio_url = synthesized_blob.public_url
-        print(f"Uploaded synthesized audio to {synthesized_blob_path}: {synthesized_audio_url}")
-
-        conversation_ref = db.collection(f"{ip_address}_{character}")
-        conversation_ref.add({
-            'user_input_id': user_input_id,
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'user_input': text,
-            'response': response,
-            'character': character,
-            'selected_language': full_language_code,
-            'recorded_audio_url': None,
-            'synthesized_audio_url': synthesized_audio_url
-        })
-
-        conversation = [doc.to_dict() for doc in conversation_ref.order_by('timestamp').stream()]
-        
-        return jsonify({
-            "transcript": text,
-            "response": response,
-            "character": character,
-            "selected_language": full_language_code,
-            "recorded_audio_url": None,
-            "synthesized_audio_url": synthesized_audio_url,
-            "conversation": conversation
-        })
+        stream = wants_stream()
+        chat_id = conversation_id(g.session_id, character)
+        def text_stages():
+            yield 'transcript', {
+                "transcript": text,
+                "selected_language": selected_language,
+                "recorded_audio_url": None
+            }
+            yield from reply_stages(chat_id, character, selected_language, text, timestamp,
+                                    incremental=stream)
+
+        stages = text_stages()
+        if stream:
+            return stream_stages(stages)
+        return collect_stages(stages)
     except Exception as e:
-        import traceback
         print(f"Error in process_text: {str(e)}")
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
-    finally:
-        if synthesized_audio_path and os.path.exists(synthesized_audio_path):
-            os.remove(synthesized_audio_path)
 
 @app.route('/clear_chat', methods=['POST'])
 def clear_chat():
     try:
         data = request.get_json()
-        ip_address = data.get('ip_address')
         character = data.get('character')
-        if not ip_address or not character:
-            return jsonify({"error": "Missing IP address or character"}), 400
-        
-        clear_collection(ip_address, character)
-        clear_storage(ip_address, character)
-        print(f"Cleared chat for IP: {ip_address}, Character: {character}")
-        return jsonify({"message": "Chat cleared"}), 200
+        if character not in character_data:
+            return jsonify({"error": "No valid character specified"}), 400
+
+        # Only the caller's own conversation can be cleared. Reads skip it as soon as
+        # it is marked; deletion carries on in the background.
+        job = start_clear_job(db, bucket, conversation_id(g.session_id, character), background_executor,
+                              turn_writer, audio_delivery)
+        print(f"Cleared chat for session {g.session_id}, Character: {character} (job {job.id})")
+        return jsonify({"message": "Chat cleared", **job.to_dict()}), 202
     except Exception as e:
         print(f"Error in clear_chat: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/clear_chat/<job_id>')
+def clear_chat_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown clear job"}), 404
+    return jsonify(job.to_dict())
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5003))
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class AudioCache:
+    """
+    Content-addressed cache of finished audio files.
+
+    Entries are keyed by a hash of everything that influences the audio and live
+    on disk under `directory`, bounded to `max_bytes` with least-recently-used
+    eviction. The most recent `memory_items` entries are also kept in memory so
+    hot lines skip the disk read. Storage URLs of already uploaded entries are
+    remembered in memory only, for at most `url_ttl` seconds after they were
+    stored or last refreshed, because the retention sweep deletes blobs that
+    go unused.
+    """
+
+    def __init__(self, directory, max_bytes, memory_items=0, max_urls=4096, extension="mp3", url_ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.max_urls = max_urls
+        self.extension = extension
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size in bytes, least recently used first
+        self._memory = OrderedDict()  # key -> bytes
+        self._urls = OrderedDict()  # key -> (public URL, time it was stored)
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the given parts into a stable cache key"""
+        encoded = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.{self.extension}")
+
+    def _load_index(self):
+        # Rebuild the LRU order from modification times left by previous runs
+        suffix = f".{self.extension}"
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(suffix)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        # Caller holds the lock (or is the constructor)
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self._memory.pop(key, None)
+            self._urls.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached bytes for key, or None on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store data under key, evicting least recently used entries if needed"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._remember(key, data)
+            self._evict()
+
+    def get_url(self, key):
+        """Return the Storage URL this entry was already uploaded to, if any"""
+        with self._lock:
+            entry = self._urls.get(key)
+            if entry is None:
+                return None
+            url, stored_at = entry
+            if self.url_ttl is not None and time.time() - stored_at > self.url_ttl:
+                del self._urls[key]
+                return None
+            self._urls.move_to_end(key)
+            return url
+
+    def put_url(self, key, url):
+        """Remember that the entry for key is available at url"""
+        with self._lock:
+            self._urls[key] = (url, time.time())
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_urls:
+                self._urls.popitem(last=False)
+
+    def refresh_url(self, key, interval):
+        """
+        True when the remembered URL for key was stored or last refreshed more than
+        interval seconds ago; its time is then reset, so the caller can touch the blob
+        """
+        with self._lock:
+            entry = self._urls.get(key)
+            if entry is None or time.time() - entry[1] <= interval:
+                return False
+            self._urls[key] = (entry[0], time.time())
+            return True
@@ -0,0 +1,126 @@
+import io
+import os
+import wave
+import av
+import numpy as np
+from ffmpeg_pool import get_pool, FfmpegPoolError
+
+# Google Speech-to-Text's preferred input: 16 kHz mono 16-bit PCM
+TARGET_SAMPLE_RATE = 16000
+# 'pyav' decodes in-process; 'ffmpeg' hands uploads to the pooled ffmpeg workers
+AUDIO_DECODER = os.getenv('AUDIO_DECODER', 'pyav')
+
+# Energy-based voice activity detection: a frame is speech when its RMS level is
+# above VAD_THRESHOLD_DBFS and within VAD_DYNAMIC_RANGE_DB of the loudest frame
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DBFS = float(os.getenv('VAD_THRESHOLD_DBFS', '-45'))
+VAD_DYNAMIC_RANGE_DB = 35
+# Silence kept around the speech, and the least speech worth transcribing
+VAD_PADDING_MS = 240
+VAD_MIN_SPEECH_MS = 150
+
+class AudioConversionError(Exception):
+    """The uploaded audio could not be decoded"""
+
+def decode_to_pcm(source, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Decode an audio upload (WebM/Opus from the browser, or anything libav reads)
+    in-process into mono 16-bit little-endian PCM at sample_rate.
+
+    Args:
+        source: bytes or a binary file-like object, e.g. the request's upload stream
+
+    Returns:
+        raw PCM bytes
+    """
+    if AUDIO_DECODER == 'ffmpeg':
+        return _decode_with_ffmpeg(source, sample_rate)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    chunks = []
+    try:
+        with av.open(source, mode="r") as container:
+            if not container.streams.audio:
+                raise AudioConversionError("No audio stream in upload")
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+            for frame in container.decode(container.streams.audio[0]):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().tobytes())
+            # Flush samples still buffered in the resampler
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray().tobytes())
+    except av.error.FFmpegError as e:
+        raise AudioConversionError(str(e)) from e
+    return b"".join(chunks)
+
+def _decode_with_ffmpeg(source, sample_rate):
+    data = source if isinstance(source, (bytes, bytearray)) else source.read()
+    try:
+        pcm = get_pool(sample_rate).convert(data)
+    except FfmpegPoolError as e:
+        raise AudioConversionError(str(e)) from e
+    if not pcm:
+        raise AudioConversionError("No audio stream in upload")
+    return pcm
+
+def encode_mp3(samples, sample_rate, bitrate=192000):
+    """
+    Encode mono int16 samples (a NumPy array) to MP3 bytes in memory.
+    No ID3 or Xing header is written, so encoded clips can be joined back to back.
+    """
+    buffer = io.BytesIO()
+    with av.open(buffer, mode="w", format="mp3",
+                 options={"id3v2_version": "0", "write_xing": "0"}) as container:
+        stream = container.add_stream("libmp3lame", rate=sample_rate)
+        stream.bit_rate = bitrate
+        stream.layout = "mono"
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        frame.pts = 0
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+def wav_to_pcm(data):
+    """Split WAV bytes (e.g. LINEAR16 from Text-to-Speech) into (pcm bytes, sample_rate)"""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise AudioConversionError("Expected mono 16-bit WAV")
+        return wav.readframes(wav.getnframes()), wav.getframerate()
+
+def pcm_to_wav(pcm, sample_rate=TARGET_SAMPLE_RATE):
+    """Wrap mono 16-bit PCM in a WAV container, in memory"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+def trim_silence(pcm, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Cut leading and trailing silence from mono 16-bit PCM, keeping VAD_PADDING_MS
+    around the speech. Returns b"" when the clip holds no speech at all.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    frame_length = sample_rate * VAD_FRAME_MS // 1000
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return b""
+    frames = samples[:frame_count * frame_length].astype(np.float32).reshape(frame_count, frame_length)
+    levels = 10 * np.log10(np.mean(np.square(frames / 32768.0), axis=1) + 1e-12)
+    threshold = max(VAD_THRESHOLD_DBFS, levels.max() - VAD_DYNAMIC_RANGE_DB)
+    voiced = np.flatnonzero(levels > threshold)
+    if len(voiced) * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        return b""
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    start = max(0, voiced[0] - padding) * frame_length
+    end = min(len(samples), (voiced[-1] + 1 + padding) * frame_length)
+    return samples[start:end].tobytes()
+
+def pcm_duration(pcm, sample_rate=TARGET_SAMPLE_RATE):
+    """Length of mono 16-bit PCM in seconds"""
+    return len(pcm) / (2 * sample_rate)
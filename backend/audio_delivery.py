@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+# How clients get generated and recorded audio:
+#   public - uploaded with a public-read ACL; clients use the Storage URL
+#   signed - uploaded privately; /audio/<name> redirects to a V4 signed URL signed locally
+#   cache  - /audio/<name> serves replies from the in-process/disk TTS cache and falls back to
+#            a signed URL; the Storage upload runs in the background, off the reply's path
+AUDIO_DELIVERY = os.getenv('AUDIO_DELIVERY', 'public')
+AUDIO_DELIVERY_MODES = ('public', 'signed', 'cache')
+SIGNED_URL_SECONDS = int(os.getenv('SIGNED_URL_SECONDS', '3600'))
+# Archive the user's recordings to Storage (in the background); the browser already has its copy
+ARCHIVE_RECORDINGS = os.getenv('ARCHIVE_RECORDINGS', '1') != '0'
+
+AUDIO_ROUTE = '/audio/'
+AUDIO_PREFIX = 'audio/'
+# The only blobs /audio/<name> hands out: synthesized replies and conversation recordings
+AUDIO_NAME_PATTERN = re.compile(r'tts/(?P<tts_key>[0-9a-f]{64})\.mp3|[0-9a-f]{32}/recorded_audio_\d+\.wav')
+
+class AudioDelivery:
+    """
+    Uploads audio and hands out the URL clients should play it from, in one of
+    AUDIO_DELIVERY_MODES. URLs are computed locally, so getting one never costs
+    a network call: public URLs follow from the blob name, and signed URLs are
+    signed with the service account key when /audio/<name> is requested.
+    """
+
+    def __init__(self, bucket, executor, mode=AUDIO_DELIVERY):
+        if mode not in AUDIO_DELIVERY_MODES:
+            raise ValueError(f"AUDIO_DELIVERY must be one of {AUDIO_DELIVERY_MODES}, not {mode!r}")
+        self.bucket = bucket
+        self.executor = executor
+        self.mode = mode
+        # Background uploads not yet finished, by blob path
+        self._uploads = {}
+        self._uploads_lock = threading.Lock()
+
+    def url_for(self, blob_path):
+        if self.mode == 'public':
+            return self.bucket.blob(blob_path).public_url
+        return AUDIO_ROUTE + blob_path[len(AUDIO_PREFIX):]
+
+    def signed_url(self, blob_path):
+        return self.bucket.blob(blob_path).generate_signed_url(
+            version='v4', expiration=timedelta(seconds=SIGNED_URL_SECONDS), method='GET')
+
+    def _upload(self, blob_path, data, content_type):
+        blob = self.bucket.blob(blob_path)
+        # The ACL goes with the upload instead of a separate make_public() request
+        blob.upload_from_string(data, content_type=content_type,
+                                predefined_acl='publicRead' if self.mode == 'public' else None)
+        print(f"Uploaded audio to {blob_path}")
+
+    def _upload_later(self, blob_path, render, content_type, on_uploaded=None):
+        try:
+            self._upload(blob_path, render(), content_type)
+        except Exception as e:
+            print(f"Background audio upload to {blob_path} failed: {str(e)}")
+            return
+        if on_uploaded is not None:
+            on_uploaded(self.url_for(blob_path))
+
+    def publish(self, blob_path, data, content_type):
+        """Upload audio (in the background in cache mode) and return its URL"""
+        if self.mode == 'cache':
+            self.executor.submit(self._upload_later, blob_path, lambda: data, content_type)
+        else:
+            self._upload(blob_path, data, content_type)
+        return self.url_for(blob_path)
+
+    def _touch(self, blob_path):
+        try:
+            blob = self.bucket.blob(blob_path)
+            # A metadata patch moves the blob's 'updated' time, which the retention sweep goes by
+            blob.metadata = {'last_used': datetime.now(timezone.utc).isoformat()}
+            blob.patch()
+        except Exception as e:
+            print(f"Refreshing {blob_path} failed: {str(e)}")
+
+    def touch_later(self, blob_path):
+        """Mark an uploaded blob as used again, in the background"""
+        self.executor.submit(self._touch, blob_path)
+
+    def publish_later(self, blob_path, render, content_type, on_uploaded=None):
+        """
+        Return the URL at once and upload render()'s bytes in the background,
+        calling on_uploaded(url) once the blob is in Storage
+        """
+        future = self.executor.submit(self._upload_later, blob_path, render, content_type, on_uploaded)
+        with self._uploads_lock:
+            self._uploads[blob_path] = future
+        future.add_done_callback(lambda done: self._forget_upload(blob_path, done))
+        return self.url_for(blob_path)
+
+    def _forget_upload(self, blob_path, future):
+        with self._uploads_lock:
+            if self._uploads.get(blob_path) is future:
+                del self._uploads[blob_path]
+
+    def uploads_under(self, prefix):
+        """Futures of the background uploads still running to blobs under prefix"""
+        with self._uploads_lock:
+            return [future for blob_path, future in self._uploads.items() if blob_path.startswith(prefix)]
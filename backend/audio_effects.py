@@ -0,0 +1,76 @@
+import numpy as np
+from scipy import signal
+
+# Character-specific audio profiles: bass/treble are shelf boosts in dB above 1.0,
+# clarity > 1.0 peak-normalizes the result
+CHARACTER_PROFILES = {
+    "jax": {"bass": 2.0, "treble": 1.0, "clarity": 1.5},
+    "victor": {"bass": 3.0, "treble": 0.8, "clarity": 1.2},
+    "lila": {"bass": 0.8, "treble": 1.4, "clarity": 1.8},
+    "elias": {"bass": 1.5, "treble": 1.2, "clarity": 1.3}
+}
+DEFAULT_PROFILE = "jax"
+
+BASS_CUTOFF_HZ = 250
+TREBLE_CUTOFF_HZ = 2000
+# Peak level after normalization, in dB below full scale
+NORMALIZE_HEADROOM_DB = 0.1
+
+_coefficients = {}  # (character, sample_rate) -> second-order sections or None
+
+def _boost_section(btype, cutoff, gain_db, sample_rate):
+    """
+    One filter section computing x + gain * filter(x) for a first-order filter,
+    i.e. the old "filter a copy, apply gain, overlay" step as a single recursion.
+    """
+    b, a = signal.butter(1, cutoff, btype=btype, fs=sample_rate)
+    gain = 10 ** (gain_db / 20)
+    numerator = a + gain * b
+    return [numerator[0] / a[0], numerator[1] / a[0], 0.0, 1.0, a[1] / a[0], 0.0]
+
+def character_filter(character, sample_rate):
+    """
+    Second-order sections applying the character's bass and treble boosts in
+    one pass, computed once per character and sample rate. None when the
+    profile boosts nothing.
+    """
+    key = (character, sample_rate)
+    if key not in _coefficients:
+        profile = CHARACTER_PROFILES.get(character, CHARACTER_PROFILES[DEFAULT_PROFILE])
+        sections = []
+        if profile["bass"] > 1.0:
+            sections.append(_boost_section("lowpass", BASS_CUTOFF_HZ, profile["bass"] - 1.0, sample_rate))
+        if profile["treble"] > 1.0:
+            sections.append(_boost_section("highpass", TREBLE_CUTOFF_HZ, profile["treble"] - 1.0, sample_rate))
+        _coefficients[key] = np.array(sections, dtype=np.float32) if sections else None
+    return _coefficients[key]
+
+def normalize(samples, headroom_db=NORMALIZE_HEADROOM_DB, full_scale=32767.0):
+    """Scale float samples in place so the peak sits headroom_db below full_scale"""
+    peak = np.max(np.abs(samples)) if samples.size else 0.0
+    if peak > 0:
+        samples *= (full_scale * 10 ** (-headroom_db / 20)) / peak
+    return samples
+
+def apply_character_effects(samples, sample_rate, character="jax"):
+    """
+    Apply a character's EQ and normalization to 16-bit PCM.
+
+    Args:
+        samples: int16 or float32 array at int16 scale, shape (frames,) or (frames, channels)
+        sample_rate: sample rate of samples in Hz
+
+    Returns:
+        processed int16 array with the same shape
+    """
+    profile = CHARACTER_PROFILES.get(character, CHARACTER_PROFILES[DEFAULT_PROFILE])
+    processed = np.asarray(samples, dtype=np.float32)
+    sos = character_filter(character, sample_rate)
+    if sos is not None:
+        processed = signal.sosfilt(sos, processed, axis=0)
+    elif processed is samples:
+        processed = processed.copy()
+    if profile["clarity"] > 1.0:
+        normalize(processed)
+    np.clip(processed, -32768, 32767, out=processed)
+    return processed.astype(np.int16)
@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from sessions import conversation_ref, messages_ref, recordings_prefix
+
+# Firestore allows 500 writes per batch
+CLEAR_BATCH_SIZE = 500
+# Storage batch requests should stay at or below 100 calls
+CLEAR_BLOB_BATCH_SIZE = 100
+# Batches committed at once
+CLEAR_WORKERS = int(os.getenv('CLEAR_WORKERS', '8'))
+# Seconds a finished job can still be polled
+CLEAR_JOB_TTL = 600
+# Recordings are named by their turn's request time in nanoseconds
+RECORDING_NAME = re.compile(r'recorded_audio_(\d+)\.wav$')
+# Longest wait for recordings still uploading at clear time
+CLEAR_UPLOAD_WAIT_SECONDS = 60
+
+_batch_executor = ThreadPoolExecutor(max_workers=CLEAR_WORKERS, thread_name_prefix='clear')
+
+class ClearJob:
+    """
+    Deletes what a conversation held when it was cleared.
+
+    Reads already skip turns at or before the conversation's 'cleared_through'.
+    Those turns go in Firestore batched writes of up to CLEAR_BATCH_SIZE and
+    recordings in Storage batch requests, with the batches committed in
+    parallel while the next ones are listed. Turns and recordings created
+    after cleared_through are left alone, so the conversation can carry on
+    while the job runs. Recordings go by the request time in their name, not
+    by when they reached Storage, and uploads still running at clear time are
+    waited for before the recordings are listed.
+    """
+
+    def __init__(self, db, bucket, conversation_id, cleared_at, uploads=()):
+        self.id = uuid.uuid4().hex
+        self.db = db
+        self.bucket = bucket
+        self.conversation_id = conversation_id
+        self.cleared_through = cleared_at
+        self.uploads = uploads
+        self.status = 'running'
+        self.deleted_documents = 0
+        self.deleted_blobs = 0
+        self.error = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "deleted_documents": self.deleted_documents,
+            "deleted_blobs": self.deleted_blobs,
+            "error": self.error
+        }
+
+    def _commit_documents(self, refs):
+        batch = self.db.batch()
+        for ref in refs:
+            batch.delete(ref)
+        batch.commit()
+        with self._lock:
+            self.deleted_documents += len(refs)
+
+    def _commit_blobs(self, blobs):
+        # Batches are thread-local on the client, so workers don't share one
+        with self.bucket.client.batch():
+            for blob in blobs:
+                blob.delete()
+        with self._lock:
+            self.deleted_blobs += len(blobs)
+
+    def _submit_chunks(self, items, size, commit):
+        futures = []
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == size:
+                futures.append(_batch_executor.submit(commit, chunk))
+                chunk = []
+        if chunk:
+            futures.append(_batch_executor.submit(commit, chunk))
+        return futures
+
+    def _recorded_before_clear(self, blob):
+        match = RECORDING_NAME.search(blob.name)
+        if match is None:
+            return blob.time_created <= self.cleared_through
+        cleared_ns = int(self.cleared_through.timestamp()) * 10**9 + self.cleared_through.microsecond * 1000
+        return int(match.group(1)) <= cleared_ns
+
+    def run(self):
+        try:
+            query = messages_ref(self.db, self.conversation_id).where(
+                filter=FieldFilter('timestamp', '<=', self.cleared_through))
+            refs = (doc.reference for doc in query.select([]).stream())
+            futures = self._submit_chunks(refs, CLEAR_BATCH_SIZE, self._commit_documents)
+            # A recording of a cleared turn may still be uploading; listing first would miss it
+            wait(self.uploads, CLEAR_UPLOAD_WAIT_SECONDS)
+            blobs = (blob for blob in self.bucket.list_blobs(prefix=recordings_prefix(self.conversation_id))
+                     if self._recorded_before_clear(blob))
+            futures += self._submit_chunks(blobs, CLEAR_BLOB_BATCH_SIZE, self._commit_blobs)
+            for future in futures:
+                future.result()
+            self.status = 'done'
+            print(f"Cleared '{self.conversation_id}': {self.deleted_documents} documents, "
+                  f"{self.deleted_blobs} blobs")
+        except Exception as e:
+            print(f"Error clearing '{self.conversation_id}': {str(e)}")
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished_at = time.monotonic()
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def start_clear_job(db, bucket, conversation_id, executor, turn_writer, audio_delivery):
+    """
+    Mark the conversation cleared, so reads stop returning it, drop its running
+    summary and delete its turns and recordings on executor. Returns the job to poll.
+    """
+    cleared_at = datetime.now(timezone.utc)
+    conversation_ref(db, conversation_id).set({
+        'cleared_through': cleared_at,
+        'last_active': cleared_at,
+        'summary': firestore.DELETE_FIELD
+    }, merge=True)
+    # Turns still queued behind the response would be stored after the job lists the
+    # conversation's messages, and never deleted
+    dropped = turn_writer.discard(conversation_id, cleared_at)
+    if dropped:
+        print(f"Dropped {dropped} unwritten turns of '{conversation_id}'")
+    job = ClearJob(db, bucket, conversation_id, cleared_at,
+                   audio_delivery.uploads_under(recordings_prefix(conversation_id)))
+    now = time.monotonic()
+    with _jobs_lock:
+        for job_id, other in list(_jobs.items()):
+            if other.finished_at is not None and now - other.finished_at > CLEAR_JOB_TTL:
+                del _jobs[job_id]
+        _jobs[job.id] = job
+    executor.submit(job.run)
+    return job
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
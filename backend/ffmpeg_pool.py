@@ -0,0 +1,209 @@
+import os
+import time
+import queue
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+FFMPEG_WORKERS = int(os.getenv('FFMPEG_WORKERS', '4'))
+# Jobs allowed to wait for a worker before callers are turned away
+FFMPEG_QUEUE_SIZE = int(os.getenv('FFMPEG_QUEUE_SIZE', '32'))
+FFMPEG_JOB_TIMEOUT = float(os.getenv('FFMPEG_JOB_TIMEOUT', '20'))
+# How long submit() waits for room in a full queue before giving up
+FFMPEG_QUEUE_TIMEOUT = float(os.getenv('FFMPEG_QUEUE_TIMEOUT', '2'))
+# Extra seconds convert() waits past both timeouts before giving up on a job
+FFMPEG_RESULT_GRACE = 5
+
+class FfmpegPoolError(Exception):
+    """A transcode job failed, timed out or could not be queued"""
+
+def pcm_command(sample_rate=16000, binary=FFMPEG_BINARY):
+    """ffmpeg arguments reading any container on stdin and writing mono s16le PCM to stdout"""
+    return [
+        binary, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'
+    ]
+
+class FfmpegPool:
+    """
+    Bounded pool of ffmpeg transcoders fed over stdin/stdout.
+
+    This is not a pool of long-lived transcoders: ffmpeg handles one input per
+    process, so every job still gets its own process. Each worker keeps the *next*
+    process already spawned and blocked on stdin, which moves process startup off
+    the request path but leaves container and codec setup on it; see the
+    benchmark below for what that buys. A worker's process is health
+    checked before it is handed a job and respawned if it has died, and a job that
+    runs past `job_timeout` is killed. Jobs wait in a bounded queue; when it is full,
+    submit() blocks for up to `queue_timeout` and then fails fast (backpressure).
+    """
+
+    def __init__(self, command, workers=FFMPEG_WORKERS, max_queue=FFMPEG_QUEUE_SIZE,
+                 job_timeout=FFMPEG_JOB_TIMEOUT, queue_timeout=FFMPEG_QUEUE_TIMEOUT):
+        self.command = command
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self.respawns = 0
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"ffmpeg-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _spawn(self):
+        try:
+            return subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise FfmpegPoolError(f"Could not start ffmpeg: {str(e)}") from e
+
+    def _warm_process(self, proc):
+        # Health check: a process that already exited cannot take a job
+        if proc is None or proc.poll() is not None:
+            if proc is not None:
+                self.respawns += 1
+                print(f"ffmpeg worker exited with code {proc.returncode}, respawning")
+            return self._spawn()
+        return proc
+
+    def _worker(self):
+        proc = None
+        while True:
+            try:
+                proc = self._warm_process(proc)
+            except FfmpegPoolError as e:
+                print(str(e))
+                proc = None
+                time.sleep(1)
+            job = self._jobs.get()
+            if job is None:
+                if proc is not None:
+                    proc.kill()
+                    proc.wait()
+                return
+            data, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                proc = self._warm_process(proc)
+                future.set_result(self._run(proc, data))
+            except Exception as e:
+                future.set_exception(e)
+            # Every process serves exactly one job; the next one is spawned on the next loop
+            proc = None
+
+    def _run(self, proc, data):
+        try:
+            output, errors = proc.communicate(input=data, timeout=self.job_timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise FfmpegPoolError(f"ffmpeg timed out after {self.job_timeout}s")
+        if proc.returncode != 0:
+            message = errors.decode('utf-8', 'replace').strip()
+            raise FfmpegPoolError(f"ffmpeg exited with code {proc.returncode}: {message}")
+        return output
+
+    def submit(self, data):
+        """Queue data for transcoding; returns a Future with the output bytes"""
+        if self._closed:
+            raise FfmpegPoolError("ffmpeg pool is shut down")
+        future = Future()
+        try:
+            self._jobs.put((data, future), timeout=self.queue_timeout)
+        except queue.Full:
+            raise FfmpegPoolError("ffmpeg pool is busy, try again later")
+        return future
+
+    def convert(self, data):
+        """Transcode data and wait for the result"""
+        future = self.submit(data)
+        try:
+            return future.result(timeout=self.queue_timeout + self.job_timeout + FFMPEG_RESULT_GRACE)
+        except FutureTimeoutError:
+            # Still queued behind stuck workers: make sure it never runs for nobody.
+            # A job that already started is killed by its own job_timeout.
+            future.cancel()
+            raise FfmpegPoolError("ffmpeg pool did not finish the job in time")
+
+    def shutdown(self):
+        """Stop the workers once queued jobs are done"""
+        self._closed = True
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(sample_rate=16000):
+    """Shared pool producing 16 kHz mono PCM, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FfmpegPool(pcm_command(sample_rate))
+        return _pool
+
+def spawn_per_request(path, sample_rate=16000):
+    """The previous conversion path: one ffmpeg process and a temp WAV per request"""
+    wav_path = f"{path}.{threading.get_ident()}.wav"
+    subprocess.run([FFMPEG_BINARY, '-y', '-i', path, '-ar', str(sample_rate), '-ac', '1', wav_path],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(wav_path, 'rb') as f:
+        data = f.read()
+    os.remove(wav_path)
+    return data
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _benchmark(name, convert, jobs, concurrency):
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        convert()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(jobs)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>18}: {jobs / elapsed:7.1f} jobs/s  "
+          f"p50 {_percentile(latencies, 0.5) * 1000:7.1f} ms  "
+          f"p99 {_percentile(latencies, 0.99) * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    # Compare spawn-per-request against the pool on a short WebM/Opus clip:
+    #   python ffmpeg_pool.py [sample.webm] [jobs] [concurrency]
+    import sys
+    import tempfile
+
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else FFMPEG_WORKERS
+    if len(sys.argv) > 1:
+        sample_path = sys.argv[1]
+    else:
+        fd, sample_path = tempfile.mkstemp(suffix='.webm')
+        os.close(fd)
+        subprocess.run([FFMPEG_BINARY, '-y', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=3',
+                        '-c:a', 'libopus', sample_path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(sample_path, 'rb') as f:
+        sample = f.read()
+
+    print(f"{jobs} jobs, concurrency {concurrency}, {len(sample)} byte input")
+    from audio_convert import decode_to_pcm
+    _benchmark("in-process PyAV", lambda: decode_to_pcm(sample), jobs, concurrency)
+    _benchmark("spawn per request", lambda: spawn_per_request(sample_path), jobs, concurrency)
+    pool = FfmpegPool(pcm_command(), workers=concurrency)
+    _benchmark("worker pool", lambda: pool.convert(sample), jobs, concurrency)
+    pool.shutdown()
+    if len(sys.argv) <= 1:
+        os.remove(sample_path)
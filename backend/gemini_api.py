@@ -1,14 +1,59 @@
 import os
+import json
+import time
+import random
+import asyncio
+import threading
+import weakref
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent"
+# GEMINI_API_BASE can point at a local stub server that speaks the same protocol
+# (v1beta is needed for systemInstruction and cachedContents)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+GEMINI_ENDPOINT = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent"
+# Server-sent events: one "data: {GenerateContentResponse}" line per chunk
+GEMINI_STREAM_ENDPOINT = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+GEMINI_CACHE_ENDPOINT = f"{GEMINI_API_BASE}/cachedContents"
 api_key = os.getenv("API_KEY")
 if not api_key:
     raise ValueError("Error: API_KEY environment variable not set.")
 
+# Connection handling for the Gemini API
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "3.05"))  # seconds
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "30"))  # seconds
+GEMINI_KEEPALIVE_TIMEOUT = float(os.getenv("GEMINI_KEEPALIVE_TIMEOUT", "60"))  # seconds
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))  # seconds
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))  # seconds
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Conversation context: recent turns are sent verbatim up to this many tokens,
+# older ones are folded into a running summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "120"))
+
+# Register each character prompt once as cached content and reference it by name.
+# Off by default: models only accept prompts above a minimum size for caching, and
+# requests fall back to an inline systemInstruction whenever no cache is available.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0").lower() in ("1", "true")
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))  # seconds
+GEMINI_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_CACHE_REFRESH_MARGIN", "300"))  # seconds before expiry
+GEMINI_CACHE_RETRY_INTERVAL = int(os.getenv("GEMINI_CACHE_RETRY_INTERVAL", "3600"))  # seconds after a failure
+
+# One keep-alive session for all requests so the TLS handshake is paid once per connection
+session = requests.Session()
+session.headers.update({"Content-Type": "application/json"})
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=GEMINI_MAX_CONCURRENCY))
+_gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> (aiohttp.ClientSession, asyncio.Semaphore)
+
 # Character prompts
 CHARACTERS = {
     "jax": {
@@ -86,34 +131,374 @@ Rules:
     }
 }
 
-def get_character_response(user_input, detected_language, character):
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "maxOutputTokens": 100
+}
+
+# Static part of every request, built once per character
+CHARACTER_REQUESTS = {
+    name: {
+        "systemInstruction": {"parts": [{"text": data["prompt"].strip()}]},
+        "generationConfig": GENERATION_CONFIG
+    }
+    for name, data in CHARACTERS.items()
+}
+
+_prompt_caches = {}  # character -> {"name", "expires_at", "retry_at", "refreshing"}
+_prompt_cache_lock = threading.Lock()
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) that avoids a countTokens round trip"""
+    return max(1, (len(text) + 3) // 4)
+
+def turn_text(turn):
+    """English text of a stored conversation turn (older turns only have the translated fields)"""
+    user_input = turn.get('user_input_en') or turn.get('user_input') or ''
+    response = turn.get('response_en') or turn.get('response') or ''
+    return user_input, response
+
+def turn_tokens(turn):
+    return turn.get('token_count') or estimate_tokens(''.join(turn_text(turn)))
+
+def recent_turns(turns, budget=HISTORY_TOKEN_BUDGET):
+    """Longest run of the newest turns whose token counts fit in budget"""
+    total = 0
+    start = len(turns)
+    while start > 0:
+        total += turn_tokens(turns[start - 1])
+        if total > budget:
+            break
+        start -= 1
+    return turns[start:]
+
+def turns_to_summarize(turns, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Oldest turns that should be rolled into the running summary, or [] while all
+    turns still fit in budget. Once over budget only half of it is kept verbatim,
+    so the summary is refreshed every few turns rather than on every turn.
+    """
+    if sum(turn_tokens(turn) for turn in turns) <= budget:
+        return []
+    keep = max(1, len(recent_turns(turns, budget // 2)))
+    return turns[:-keep]
+
+def build_payload(user_input, detected_language, character, history=None, summary=None, use_cache=True):
+    """
+    Gemini request for user_input. history is a list of earlier turns (oldest
+    first) sent as alternating user/model contents; summary covers the turns
+    before them. The character prompt is referenced as cached content when one
+    is registered, otherwise it is sent as the systemInstruction.
+    """
     if character not in CHARACTERS:
         raise ValueError(f"Invalid character: {character}. Must be one of {list(CHARACTERS.keys())}")
-    
+    cache_name = prompt_cache_name(character) if use_cache else None
+    payload = dict(CHARACTER_REQUESTS[character]) if cache_name is None else {
+        "cachedContent": cache_name,
+        "generationConfig": GENERATION_CONFIG
+    }
+    contents = []
+    for turn in history or []:
+        turn_input, turn_response = turn_text(turn)
+        contents.append({"role": "user", "parts": [{"text": turn_input}]})
+        contents.append({"role": "model", "parts": [{"text": turn_response}]})
+    context = f"Summary of your conversation so far: {summary}\n" if summary else ""
+    contents.append({
+        "role": "user",
+        "parts": [
+            {"text": f"{context}User says (in {detected_language}): {user_input}\nRespond in {detected_language}:"}
+        ]
+    })
+    payload["contents"] = contents
+    return payload
+
+def prompt_cache_name(character):
+    """
+    Name of the cached content holding the character prompt, or None if it is
+    not usable right now. Creation and TTL refreshes run on a background thread,
+    so requests never wait for them.
+    """
+    if not GEMINI_CONTEXT_CACHE:
+        return None
+    now = time.monotonic()
+    with _prompt_cache_lock:
+        entry = _prompt_caches.setdefault(character, {"name": None, "expires_at": 0, "retry_at": 0, "refreshing": False})
+        needs_refresh = (entry["expires_at"] - now < GEMINI_CACHE_REFRESH_MARGIN
+                         and now >= entry["retry_at"] and not entry["refreshing"])
+        if needs_refresh:
+            entry["refreshing"] = True
+        name = entry["name"] if entry["expires_at"] > now else None
+    if needs_refresh:
+        threading.Thread(target=_refresh_prompt_cache, args=(character,), daemon=True).start()
+    return name
+
+def _refresh_prompt_cache(character):
+    """Create the cached content for a character, or extend the TTL of the existing one"""
+    with _prompt_cache_lock:
+        name = _prompt_caches[character]["name"]
+    ttl = f"{GEMINI_CACHE_TTL}s"
     try:
-        character_data = CHARACTERS[character]
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": f"{character_data['prompt']}\nUser says (in {detected_language}): {user_input}\nRespond in {detected_language}:"}
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.9,
-                "maxOutputTokens": 100
-            }
+        if name:
+            response = session.patch(_with_key(f"{GEMINI_API_BASE}/{name}?updateMask=ttl"), json={"ttl": ttl},
+                                     timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
+        if not name or response.status_code != 200:
+            response = session.post(_with_key(GEMINI_CACHE_ENDPOINT), json={
+                "model": f"models/{GEMINI_MODEL}",
+                "systemInstruction": CHARACTER_REQUESTS[character]["systemInstruction"],
+                "ttl": ttl
+            }, timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} - {response.text}")
+        name = response.json()["name"]
+        with _prompt_cache_lock:
+            _prompt_caches[character].update(name=name, expires_at=time.monotonic() + GEMINI_CACHE_TTL)
+        print(f"Cached prompt for {character} as {name}")
+    except Exception as e:
+        print(f"Prompt caching unavailable for {character}, using systemInstruction: {str(e)}")
+        with _prompt_cache_lock:
+            _prompt_caches[character].update(retry_at=time.monotonic() + GEMINI_CACHE_RETRY_INTERVAL)
+    finally:
+        with _prompt_cache_lock:
+            _prompt_caches[character]["refreshing"] = False
+
+def cache_rejected(payload, status_code):
+    """
+    True if a request that referenced cached content was rejected because of it
+    (e.g. the cache expired early or was deleted). The cache is then dropped so
+    the caller can resend with the inline prompt.
+    """
+    if "cachedContent" not in payload or status_code not in (400, 403, 404):
+        return False
+    with _prompt_cache_lock:
+        for entry in _prompt_caches.values():
+            if entry["name"] == payload["cachedContent"]:
+                entry.update(name=None, expires_at=0)
+    print(f"Cached prompt {payload['cachedContent']} was rejected, falling back to systemInstruction")
+    return True
+
+def summarize_turns(character, previous_summary, turns):
+    """
+    Fold turns into the running conversation summary. Returns the new summary,
+    or None if the API call failed so the caller can keep the previous one.
+    """
+    transcript = "\n".join(
+        f"User: {turn_input}\n{character.capitalize()}: {turn_response}"
+        for turn_input, turn_response in map(turn_text, turns)
+    )
+    previous = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+    payload = {
+        "contents": [{
+            "role": "user",
+            "parts": [{"text": (
+                f"{previous}New messages:\n{transcript}\n\n"
+                f"Write an updated summary of this conversation between the user and {character.capitalize()} "
+                f"in at most {SUMMARY_MAX_WORDS} words. Keep facts about the user, open questions and "
+                "anything the user asked to remember. Reply with the summary only."
+            )}]
+        }],
+        "generationConfig": {
+            "temperature": 0.2,
+            "maxOutputTokens": SUMMARY_MAX_WORDS * 2
         }
-        response = requests.post(f"{GEMINI_ENDPOINT}?key={api_key}", json=payload, headers=headers)
+    }
+    try:
+        response = post_gemini(payload)
+        if response.status_code != 200:
+            print(f"Summary request failed: {response.status_code} - {response.text}")
+            return None
+        return json.loads(response.text)["candidates"][0]["content"]["parts"][0]["text"].strip()
+    except Exception as e:
+        print(f"Summary request failed: {str(e)}")
+        return None
+
+def parse_response(status_code, body):
+    if status_code == 200:
+        try:
+            return json.loads(body)["candidates"][0]["content"]["parts"][0]["text"]
+        except KeyError as e:
+            return f"Well, looks like the universe broke. Technical glitch: {str(e)}"
+    else:
+        return f"Error: {status_code} - {body}"
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+    if retry_after:
+        try:
+            return min(float(retry_after), GEMINI_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
 
-        if response.status_code == 200:
-            try:
-                return response.json()["candidates"][0]["content"]["parts"][0]["text"]
-            except KeyError as e:
-                return f"Well, looks like the universe broke. Technical glitch: {str(e)}"
+def _post_with_retries(url, payload, stream=False):
+    """
+    POST payload over the pooled keep-alive session, retrying connection errors,
+    timeouts, 429 and 5xx responses up to GEMINI_MAX_RETRIES times with jittered
+    backoff. Returns the last requests.Response.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            response = session.post(url, json=payload, stream=stream,
+                                    timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Gemini request failed ({str(e)}), retrying in {delay:.2f}s")
         else:
-            return f"Error: {response.status_code} - {response.text}"
+            if response.status_code not in RETRY_STATUS_CODES or attempt == GEMINI_MAX_RETRIES:
+                return response
+            response.close()
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            print(f"Gemini returned {response.status_code}, retrying in {delay:.2f}s")
+        time.sleep(delay)
+
+def _with_key(url):
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}key={api_key}"
+
+def post_gemini(payload):
+    """
+    POST payload to generateContent. At most GEMINI_MAX_CONCURRENCY requests are
+    in flight at once.
+    """
+    with _gemini_slots:
+        return _post_with_retries(_with_key(GEMINI_ENDPOINT), payload)
+
+def get_character_response(user_input, detected_language, character, history=None, summary=None):
+    payload = build_payload(user_input, detected_language, character, history, summary)
+    try:
+        response = post_gemini(payload)
+        if cache_rejected(payload, response.status_code):
+            payload = build_payload(user_input, detected_language, character, history, summary, use_cache=False)
+            response = post_gemini(payload)
+        return parse_response(response.status_code, response.text)
     except Exception as e:
         return f"Oops, something crashed hard: {str(e)}"
+
+def chunk_text(chunk):
+    """Text carried by one streamed GenerateContentResponse (empty for metadata-only chunks)"""
+    try:
+        parts = chunk["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError):
+        return ""
+    return "".join(part.get("text", "") for part in parts)
+
+def parse_sse_line(line):
+    """Decode one server-sent event line; returns None for blank, comment and non-data lines"""
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    return json.loads(data) if data else None
+
+def stream_character_response(user_input, detected_language, character, history=None, summary=None):
+    """
+    Generator variant of get_character_response backed by streamGenerateContent.
+    Yields text deltas as the model produces them.
+
+    Raises:
+        RuntimeError if the API answers with an error status
+    """
+    payload = build_payload(user_input, detected_language, character, history, summary)
+    with _gemini_slots:
+        response = _post_with_retries(_with_key(GEMINI_STREAM_ENDPOINT), payload, stream=True)
+        if cache_rejected(payload, response.status_code):
+            response.close()
+            payload = build_payload(user_input, detected_language, character, history, summary, use_cache=False)
+            response = _post_with_retries(_with_key(GEMINI_STREAM_ENDPOINT), payload, stream=True)
+        with response:
+            if response.status_code != 200:
+                raise RuntimeError(parse_response(response.status_code, response.text))
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                chunk = parse_sse_line(line)
+                if chunk is None:
+                    continue
+                text = chunk_text(chunk)
+                if text:
+                    yield text
+
+async def _async_client():
+    # aiohttp sessions are bound to the event loop that created them
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        connector = aiohttp.TCPConnector(limit=GEMINI_MAX_CONCURRENCY, keepalive_timeout=GEMINI_KEEPALIVE_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(sock_connect=GEMINI_CONNECT_TIMEOUT, sock_read=GEMINI_READ_TIMEOUT)
+        client = (aiohttp.ClientSession(connector=connector, timeout=timeout),
+                  asyncio.Semaphore(GEMINI_MAX_CONCURRENCY))
+        _async_clients[loop] = client
+    return client
+
+async def _post_with_retries_async(client_session, url, payload):
+    """
+    asyncio counterpart of _post_with_retries. Returns the last aiohttp response,
+    unread; the caller must release it.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            response = await client_session.post(url, json=payload)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Gemini request failed ({str(e)}), retrying in {delay:.2f}s")
+        else:
+            if response.status not in RETRY_STATUS_CODES or attempt == GEMINI_MAX_RETRIES:
+                return response
+            response.release()
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            print(f"Gemini returned {response.status}, retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+async def post_gemini_async(payload):
+    """
+    asyncio counterpart of post_gemini. Returns (status_code, body).
+    """
+    client_session, slots = await _async_client()
+    async with slots:
+        response = await _post_with_retries_async(client_session, _with_key(GEMINI_ENDPOINT), payload)
+        async with response:
+            return response.status, await response.text()
+
+async def get_character_response_async(user_input, detected_language, character, history=None, summary=None):
+    payload = build_payload(user_input, detected_language, character, history, summary)
+    try:
+        status_code, body = await post_gemini_async(payload)
+        if cache_rejected(payload, status_code):
+            payload = build_payload(user_input, detected_language, character, history, summary, use_cache=False)
+            status_code, body = await post_gemini_async(payload)
+        return parse_response(status_code, body)
+    except Exception as e:
+        return f"Oops, something crashed hard: {str(e)}"
+
+async def stream_character_response_async(user_input, detected_language, character, history=None, summary=None):
+    """
+    Async-iterator variant of stream_character_response.
+
+    Raises:
+        RuntimeError if the API answers with an error status
+    """
+    payload = build_payload(user_input, detected_language, character, history, summary)
+    client_session, slots = await _async_client()
+    async with slots:
+        response = await _post_with_retries_async(client_session, _with_key(GEMINI_STREAM_ENDPOINT), payload)
+        if cache_rejected(payload, response.status):
+            response.release()
+            payload = build_payload(user_input, detected_language, character, history, summary, use_cache=False)
+            response = await _post_with_retries_async(client_session, _with_key(GEMINI_STREAM_ENDPOINT), payload)
+        async with response:
+            if response.status != 200:
+                raise RuntimeError(parse_response(response.status, await response.text()))
+            async for raw_line in response.content:
+                chunk = parse_sse_line(raw_line.decode("utf-8").strip())
+                if chunk is None:
+                    continue
+                text = chunk_text(chunk)
+                if text:
+                    yield text
+
+async def close_async_client():
+    """Close the aiohttp session of the running event loop, if one was opened"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client[0].close()
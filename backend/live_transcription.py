@@ -0,0 +1,112 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from transcribe_audio import stream_transcripts
+
+# A session that receives no audio for this long is ended and forgotten
+LIVE_SESSION_TIMEOUT = float(os.getenv('LIVE_SESSION_TIMEOUT', '20'))
+# End recognition when the speaker stops talking instead of waiting for the recording to stop
+LIVE_SINGLE_UTTERANCE = os.getenv('LIVE_SINGLE_UTTERANCE', '1') != '0'
+
+class LiveTranscription:
+    """
+    One microphone recording transcribed while it is being made.
+
+    Audio chunks posted by the browser are queued to a background thread that
+    feeds them to stream_transcripts. Its results are queued back as
+    ('interim', ...) events, followed by one ('final', ...) or ('error', ...)
+    event once recognition is over. The raw recording is kept for archiving.
+    """
+
+    def __init__(self, conversation_id, character, language):
+        self.id = uuid.uuid4().hex
+        self.conversation_id = conversation_id
+        self.character = character
+        self.language = language
+        self.recording = bytearray()
+        self.last_activity = time.monotonic()
+        self.finished = False
+        self._audio = queue.Queue()
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self._recognize, name=f"live-{self.id[:8]}", daemon=True)
+        self._thread.start()
+
+    def feed(self, chunk):
+        """Queue a chunk of recorded audio; ignored once recognition is over"""
+        self.last_activity = time.monotonic()
+        if self.finished:
+            return
+        self.recording += chunk
+        self._audio.put(chunk)
+
+    def end(self):
+        """No more audio will follow"""
+        self._audio.put(None)
+
+    def _chunks(self):
+        while True:
+            try:
+                chunk = self._audio.get(timeout=LIVE_SESSION_TIMEOUT)
+            except queue.Empty:
+                print(f"Live session {self.id} received no audio for {LIVE_SESSION_TIMEOUT}s")
+                return
+            if chunk is None:
+                return
+            yield chunk
+
+    def _recognize(self):
+        finals = []
+        try:
+            for transcript, is_final in stream_transcripts(self._chunks(), self.language,
+                                                           single_utterance=LIVE_SINGLE_UTTERANCE):
+                if is_final:
+                    finals.append(transcript.strip())
+                    self._events.put(('interim', {"transcript": " ".join(finals)}))
+                else:
+                    self._events.put(('interim', {"transcript": " ".join(finals + [transcript.strip()])}))
+            self._events.put(('final', {"transcript": " ".join(finals).strip()}))
+        except Exception as e:
+            print(f"Error during live transcription: {str(e)}")
+            self._events.put(('error', {"error": "Live transcription failed"}))
+        finally:
+            self.finished = True
+
+    def results(self):
+        """Yield (event, payload) pairs until the final transcript or an error"""
+        while True:
+            try:
+                event, payload = self._events.get(timeout=LIVE_SESSION_TIMEOUT * 2)
+            except queue.Empty:
+                yield 'error', {"error": "Live transcription timed out"}
+                return
+            yield event, payload
+            if event != 'interim':
+                return
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def start_session(conversation_id, character, language):
+    """Start a live transcription and forget sessions that went quiet"""
+    now = time.monotonic()
+    session = LiveTranscription(conversation_id, character, language)
+    with _sessions_lock:
+        for session_id, other in list(_sessions.items()):
+            if now - other.last_activity > LIVE_SESSION_TIMEOUT * 3:
+                other.end()
+                del _sessions[session_id]
+        _sessions[session.id] = session
+    return session
+
+def get_session(session_id):
+    with _sessions_lock:
+        return _sessions.get(session_id)
+
+def end_session(session_id):
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session is not None:
+        session.end()
+    return session
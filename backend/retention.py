@@ -0,0 +1,223 @@
+import os
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from sessions import CONVERSATIONS_COLLECTION, MESSAGES_COLLECTION, recordings_prefix
+from audio_delivery import AUDIO_PREFIX, AUDIO_ROUTE
+
+# Conversations whose newest turn is older than this are deleted, with their audio.
+# Shared TTS audio expires the same long after it was last used, once no turn links to it.
+# 0 keeps everything.
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', '7'))
+RETENTION_TTL = timedelta(days=RETENTION_DAYS)
+# A reused TTS blob is touched (its 'updated' time bumped) when its last touch is older than
+# this, and swept this much later than the TTL, so it outlives every turn that links to it
+SHARED_AUDIO_TOUCH_INTERVAL = timedelta(hours=float(os.getenv('SHARED_AUDIO_TOUCH_HOURS', '12')))
+# Seconds between sweeps, and before the first one so startup is never held up
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+RETENTION_START_DELAY = float(os.getenv('RETENTION_START_DELAY', '60'))
+# Deletes per Firestore batch (Firestore allows 500 writes per batch)
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '200'))
+# Storage batch requests should stay at or below 100 calls
+RETENTION_BLOB_BATCH_SIZE = 100
+RETENTION_DELETES_PER_SECOND = float(os.getenv('RETENTION_DELETES_PER_SECOND', '100'))
+# Progress and the lease that keeps instances from sweeping at the same time
+RETENTION_STATE_COLLECTION = '_retention'
+RETENTION_LEASE_SECONDS = 300
+SHARED_AUDIO_PREFIX = 'audio/tts/'
+
+class RetentionSweeper:
+    """
+    Background garbage collection of expired conversations and audio.
+
+    A sweep queries conversations by their indexed 'last_active' timestamp,
+    deleting expired ones (their messages, recordings and the conversation
+    document last) in batches, then deletes shared TTS blobs not used within
+    the TTL (plus SHARED_AUDIO_TOUCH_INTERVAL) that no remaining turn links to.
+    A blob an older turn of a still-active conversation links to is touched
+    instead, so it is checked again only after another TTL.
+    Deletes are rate limited. Deleted conversations drop out of the query and
+    the Storage page reached is checkpointed in Firestore, so a sweep
+    interrupted by a restart resumes where it stopped. A lease in the same
+    document lets only one instance sweep at a time. stop() returns within one
+    batch.
+    """
+
+    def __init__(self, db, bucket):
+        self.db = db
+        self.bucket = bucket
+        self.owner = uuid.uuid4().hex
+        self._state_ref = db.collection(RETENTION_STATE_COLLECTION).document('state')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+
+    def start(self):
+        if RETENTION_DAYS > 0:
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Finish the current batch, checkpoint and return"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self):
+        if self._stop.wait(RETENTION_START_DELAY):
+            return
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {str(e)}")
+            self._stop.wait(RETENTION_INTERVAL)
+
+    def _throttle(self, deletes):
+        # Returns True when asked to stop
+        return self._stop.wait(deletes / RETENTION_DELETES_PER_SECOND)
+
+    def _acquire_lease(self):
+        @firestore.transactional
+        def acquire(transaction):
+            snapshot = self._state_ref.get(transaction=transaction)
+            state = snapshot.to_dict() if snapshot.exists else {}
+            now = datetime.now(timezone.utc)
+            if state.get('lease_owner') not in (None, self.owner) and state.get('lease_until') and state['lease_until'] > now:
+                return None
+            last_completed = state.get('last_completed')
+            if not state.get('cutoff') and last_completed and now - last_completed < timedelta(seconds=RETENTION_INTERVAL):
+                return None
+            state['lease_owner'] = self.owner
+            state['lease_until'] = now + timedelta(seconds=RETENTION_LEASE_SECONDS)
+            # A new sweep fixes its cutoff; a resumed one keeps the interrupted sweep's
+            state.setdefault('cutoff', now - RETENTION_TTL)
+            transaction.set(self._state_ref, state)
+            return state
+        return acquire(self.db.transaction())
+
+    def _checkpoint(self, **progress):
+        progress['lease_until'] = datetime.now(timezone.utc) + timedelta(seconds=RETENTION_LEASE_SECONDS)
+        self._state_ref.set(progress, merge=True)
+
+    def _release_lease(self):
+        self._state_ref.set({'lease_owner': firestore.DELETE_FIELD, 'lease_until': firestore.DELETE_FIELD}, merge=True)
+
+    def sweep(self):
+        """Run (or resume) one sweep; returns the number of deleted documents and blobs"""
+        state = self._acquire_lease()
+        if state is None:
+            return 0
+        cutoff = state['cutoff']
+        print(f"Retention sweep: removing conversations idle since {cutoff.isoformat()}")
+        try:
+            deleted = self._sweep_conversations(cutoff)
+            shared = None if deleted is None else self._sweep_shared_audio(cutoff, state.get('page_token'))
+        except Exception:
+            self._release_lease()
+            raise
+        if shared is None:
+            # Stopped part way: the checkpoint stays for the next sweep, the lease goes now
+            self._release_lease()
+            return deleted or 0
+        self._state_ref.set({
+            'cutoff': firestore.DELETE_FIELD,
+            'page_token': firestore.DELETE_FIELD,
+            'lease_owner': firestore.DELETE_FIELD,
+            'lease_until': firestore.DELETE_FIELD,
+            'last_completed': datetime.now(timezone.utc)
+        }, merge=True)
+        print(f"Retention sweep finished: {deleted + shared} documents and blobs deleted")
+        return deleted + shared
+
+    def _sweep_conversations(self, cutoff):
+        # Returns None when stopped part way
+        deleted = 0
+        expired_query = (self.db.collection(CONVERSATIONS_COLLECTION)
+                         .where(filter=FieldFilter('last_active', '<', cutoff))
+                         .order_by('last_active')
+                         .limit(RETENTION_BATCH_SIZE))
+        while True:
+            expired = list(expired_query.stream())
+            if not expired:
+                return deleted
+            for conversation in expired:
+                count = self._delete_collection(conversation.reference.collection(MESSAGES_COLLECTION))
+                if count is None:
+                    return None
+                blobs = self._delete_blobs(self.bucket.list_blobs(prefix=recordings_prefix(conversation.id)))
+                if blobs is None:
+                    return None
+                # Deleted last, so an interrupted sweep finds the conversation again
+                conversation.reference.delete()
+                deleted += count + blobs + 1
+                print(f"Retention: deleted conversation {conversation.id} ({count} messages, {blobs} blobs)")
+                self._checkpoint()
+
+    def _delete_collection(self, collection):
+        deleted = 0
+        while True:
+            docs = list(collection.limit(RETENTION_BATCH_SIZE).stream())
+            if not docs:
+                return deleted
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+            if self._throttle(len(docs)):
+                return None
+
+    def _delete_blobs(self, blobs):
+        deleted = 0
+        chunk = []
+        for blob in blobs:
+            chunk.append(blob)
+            if len(chunk) == RETENTION_BLOB_BATCH_SIZE:
+                deleted += self._delete_blob_batch(chunk)
+                chunk = []
+                if self._throttle(RETENTION_BLOB_BATCH_SIZE):
+                    return None
+        if chunk:
+            deleted += self._delete_blob_batch(chunk)
+        return deleted
+
+    def _delete_blob_batch(self, blobs):
+        # One HTTP request for the whole chunk of at most RETENTION_BLOB_BATCH_SIZE calls
+        with self.bucket.client.batch():
+            for blob in blobs:
+                blob.delete()
+        return len(blobs)
+
+    def _sweep_shared_audio(self, cutoff, page_token):
+        deleted = 0
+        blobs = self.bucket.list_blobs(prefix=SHARED_AUDIO_PREFIX, page_size=RETENTION_BATCH_SIZE,
+                                       page_token=page_token)
+        for page in blobs.pages:
+            # 'updated' moves forward each time a reply reuses the blob (see AudioDelivery.touch_later)
+            unused = [blob for blob in page if blob.updated < cutoff - SHARED_AUDIO_TOUCH_INTERVAL]
+            expired = []
+            for blob in unused:
+                if self._linked(blob):
+                    self._touch(blob)
+                else:
+                    expired.append(blob)
+            count = self._delete_blobs(expired)
+            if count is None:
+                return None
+            deleted += count
+            self._checkpoint(page_token=blobs.next_page_token)
+        return deleted
+
+    def _linked(self, blob):
+        # Expired conversations are gone by now, so any turn found belongs to a live one.
+        # The URL a turn stores depends on the AUDIO_DELIVERY mode it was written under.
+        urls = [blob.public_url, AUDIO_ROUTE + blob.name[len(AUDIO_PREFIX):]]
+        query = (self.db.collection_group(MESSAGES_COLLECTION)
+                 .where(filter=FieldFilter('synthesized_audio_url', 'in', urls))
+                 .limit(1))
+        return any(True for _ in query.stream())
+
+    def _touch(self, blob):
+        blob.metadata = {'last_used': datetime.now(timezone.utc).isoformat()}
+        blob.patch()
@@ -0,0 +1,41 @@
+import os
+import re
+import uuid
+import hashlib
+
+# Each browser gets a random session id in this cookie; its conversations are keyed by it
+SESSION_COOKIE = os.getenv('SESSION_COOKIE', 'dallbot_session')
+SESSION_MAX_AGE = int(os.getenv('SESSION_MAX_AGE', str(365 * 24 * 3600)))
+# Number of reverse proxies in front of the app whose X-Forwarded-For / X-Forwarded-Proto
+# headers are trusted (0 when clients connect directly)
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+
+# conversations/{session}_{character} holds the running summary, the clear marker and
+# 'last_active' (indexed, for retention); its turns are in the messages subcollection
+CONVERSATIONS_COLLECTION = 'conversations'
+MESSAGES_COLLECTION = 'messages'
+
+_SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+def valid_session_id(value):
+    """Only ids this app issued, so they are safe in document ids and Storage paths"""
+    return bool(value) and _SESSION_ID_PATTERN.fullmatch(value) is not None
+
+def conversation_id(session_id, character):
+    return f"{session_id}_{character}"
+
+def conversation_ref(db, conversation_id):
+    return db.collection(CONVERSATIONS_COLLECTION).document(conversation_id)
+
+def messages_ref(db, conversation_id):
+    return conversation_ref(db, conversation_id).collection(MESSAGES_COLLECTION)
+
+def recordings_prefix(conversation_id):
+    """
+    Storage folder of a conversation's recordings. It is named by a hash so
+    recording URLs handed to the browser don't reveal the session id.
+    """
+    return f"audio/{hashlib.sha256(conversation_id.encode('utf-8')).hexdigest()[:32]}/"
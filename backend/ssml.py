@@ -0,0 +1,100 @@
+import re
+from xml.sax.saxutils import escape
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+# A sentence runs up to its final punctuation; punctuation followed directly by a
+# non-space (e.g. "3.14") does not end it, and trailing text without punctuation counts
+SENTENCE_PATTERN = re.compile(r'(?:[^.!?]|[.!?](?=\S))+[.!?]*')
+TOKEN_PATTERN = re.compile(r"(?P<word>\w+(?:['’]\w+)*)|(?P<pause>[,;:])\s*|(?P<space>\s+)|(?P<other>.)", re.DOTALL)
+
+EMPHASIS_WORDS = frozenset({'must', 'critical', 'important', 'necessary', 'essential', 'key', 'vital'})
+# Pause after in-sentence punctuation
+PAUSES = {',': '200ms', ';': '300ms', ':': '250ms'}
+# How each sentence ending is voiced, and the pause that follows it
+ENDINGS = {
+    '.': '.',
+    '?': '<break time="100ms"/>?',
+    '!': '<break time="50ms"/>!',
+}
+ENDING_PAUSES = {'.': '400ms', '?': '500ms', '!': '500ms'}
+BREATH = '<break time="600ms"/><mark name="breath"/>'
+# Sentences longer than this are slowed down slightly for clarity
+LONG_SENTENCE_WORDS = 15
+
+def _render_sentence(sentence):
+    parts = []
+    words = 0
+    for match in TOKEN_PATTERN.finditer(sentence):
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == 'word':
+            words += 1
+            if token.lower() in EMPHASIS_WORDS:
+                parts.append(f'<emphasis level="moderate">{escape(token)}</emphasis>')
+            else:
+                parts.append(escape(token))
+        elif kind == 'pause':
+            parts.append(f'{token} <break time="{PAUSES[token]}"/>')
+        elif kind == 'space':
+            parts.append(' ')
+        else:
+            parts.append(escape(token))
+    body = ''.join(parts)
+    if words > LONG_SENTENCE_WORDS:
+        body = f'<prosody rate="95%">{body}</prosody>'
+    return body
+
+def _render_paragraph(paragraph):
+    sentences = [match.group().strip() for match in SENTENCE_PATTERN.finditer(paragraph)]
+    sentences = [sentence for sentence in sentences if sentence]
+    parts = []
+    for index, sentence in enumerate(sentences):
+        stripped = sentence.rstrip('.!?')
+        ending = sentence[len(stripped):]
+        # The first mark sets how the ending is voiced; the rest ("...", "?!") is kept as written
+        mark = ending[:1]
+        parts.append(_render_sentence(stripped))
+        if mark:
+            parts.append(ENDINGS[mark] + ending[1:])
+        following = sentences[index + 1] if index + 1 < len(sentences) else None
+        if following is None:
+            continue
+        # A new sentence starting with a capital letter is where the speaker breathes
+        if following[0].isupper():
+            parts.append(f' {BREATH}')
+        elif mark:
+            parts.append(f' <break time="{ENDING_PAUSES[mark]}"/>')
+        else:
+            parts.append(' ')
+    return ''.join(parts)
+
+def analyze_text_for_prosody(text):
+    """
+    Build SSML with natural prosody for text in a single pass over it:
+    - Pauses at commas, semicolons, colons and between sentences
+    - Breaks around questions and exclamations
+    - Moderate emphasis on important words
+    - Breath marks (<mark name="breath"/>) before capitalized sentences
+    - Slightly slower rate for long sentences
+    Existing tags are stripped and the text is XML-escaped, so the result is well formed.
+    """
+    text = TAG_PATTERN.sub('', text)
+    paragraphs = [_render_paragraph(paragraph) for paragraph in PARAGRAPH_PATTERN.split(text)]
+    return '<speak>' + ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs if paragraph) + '</speak>'
+
+if __name__ == "__main__":
+    # Micro-benchmark (golden outputs are in tests/test_ssml.py): python ssml.py
+    import time
+    from xml.dom import minidom
+
+    sample = "Well, this is important: you must listen. Are you ready? Let's go! " * 4
+    for repeat in (1, 10, 100):
+        text = sample * repeat
+        runs = max(1, 200 // repeat)
+        start = time.perf_counter()
+        for _ in range(runs):
+            result = analyze_text_for_prosody(text)
+        elapsed = (time.perf_counter() - start) / runs
+        minidom.parseString(result)
+        print(f"{len(text):>7} chars: {elapsed * 1000:8.3f} ms ({len(text) / elapsed / 1e6:.2f} M chars/s)")
@@ -9,10 +9,19 @@ const recordingStatus = document.getElementById('recordingStatus');
 
 // These variables are set in the HTML script tag
 // const selectedCharacter = ...;
-// const ipAddress = ...;
+// const liveTranscription = ...;
+// const clientVad = ...;
 
 let isReloading = false;
 
+// Pagination state: conversations are loaded a page at a time and merged by id
+const HISTORY_PAGE_SIZE = 20;
+const knownMessageIds = new Set();
+let oldestCursor = null;
+let newestCursor = null;
+let hasMoreHistory = false;
+let loadingHistory = false;
+
 async function showLoading(isRecording = false) {
     const loadingDiv = document.createElement('div');
     loadingDiv.classList.add('loading-message');
@@ -26,7 +35,14 @@ function removeLoading(loadingDiv) {
     if (loadingDiv) loadingDiv.remove();
 }
 
-function syncConversation(conversation) {
+function resetConversationState() {
+    knownMessageIds.clear();
+    oldestCursor = null;
+    newestCursor = null;
+    hasMoreHistory = false;
+}
+
+function syncConversation(conversation, hasMore = false) {
     const characterShowcase = document.getElementById('characterShowcase');
     Array.from(chatMessages.children).forEach(child => {
         if (child !== characterShowcase) {
@@ -36,13 +52,72 @@ function syncConversation(conversation) {
     if (!chatMessages.contains(characterShowcase)) {
         chatMessages.insertBefore(characterShowcase, chatMessages.firstChild);
     }
-    conversation.forEach(conv => {
-        addMessage(conv.user_input, true, conv.character, conv.recorded_audio_url);
-        addMessage(conv.response, false, conv.character, conv.synthesized_audio_url);
+    resetConversationState();
+    mergeMessages(conversation);
+    hasMoreHistory = hasMore;
+}
+
+// Records a stored message so later pages and deltas don't render it twice.
+function trackMessage(conv) {
+    knownMessageIds.add(conv.id);
+    if (oldestCursor === null || conv.cursor < oldestCursor) oldestCursor = conv.cursor;
+    if (newestCursor === null || conv.cursor > newestCursor) newestCursor = conv.cursor;
+}
+
+// Renders stored turns that aren't on screen yet. Older pages go above the
+// existing messages, everything else is appended.
+function mergeMessages(messages, prepend = false) {
+    const characterShowcase = document.getElementById('characterShowcase');
+    const anchor = prepend ? characterShowcase.nextSibling : null;
+    messages.forEach(conv => {
+        if (knownMessageIds.has(conv.id)) return;
+        trackMessage(conv);
+        addMessage(conv.user_input, true, conv.character, conv.recorded_audio_url, anchor);
+        addMessage(conv.response, false, conv.character, conv.synthesized_audio_url, anchor);
     });
 }
 
-function addMessage(content, isUser, character = selectedCharacter, audioUrl = null) {
+async function fetchConversationPage(params) {
+    const query = new URLSearchParams(params);
+    const response = await fetch(`/conversation/${selectedCharacter}?${query}`);
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || 'Failed to load conversation.');
+    return data;
+}
+
+// Lazy back-scroll: load the page before the oldest message on screen.
+async function loadOlderMessages() {
+    if (!hasMoreHistory || loadingHistory || oldestCursor === null) return;
+    loadingHistory = true;
+    try {
+        const data = await fetchConversationPage({ start_after: oldestCursor, limit: HISTORY_PAGE_SIZE });
+        const previousHeight = chatMessages.scrollHeight;
+        mergeMessages(data.messages, true);
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+        hasMoreHistory = data.has_more;
+    } catch (err) {
+        console.error(err);
+    } finally {
+        loadingHistory = false;
+    }
+}
+
+// Picks up turns stored since the newest one on screen (e.g. from another tab).
+async function loadNewMessages() {
+    try {
+        let data;
+        do {
+            data = newestCursor === null
+                ? await fetchConversationPage({ limit: HISTORY_PAGE_SIZE })
+                : await fetchConversationPage({ since: newestCursor, limit: HISTORY_PAGE_SIZE });
+            mergeMessages(data.messages);
+        } while (newestCursor !== null && data.has_more && data.messages.length);
+    } catch (err) {
+        console.error(err);
+    }
+}
+
+function addMessage(content, isUser, character = selectedCharacter, audioUrl = null, beforeNode = null) {
     const messageDiv = document.createElement('div');
     messageDiv.classList.add('message', isUser ? 'user' : 'character');
     messageDiv.style.opacity = '0';
@@ -50,30 +125,251 @@ function addMessage(content, isUser, character = selectedCharacter, audioUrl = n
     const messageContent = document.createElement('div');
     messageContent.classList.add('message-content');
     if (!isUser) {
-        messageContent.textContent = `${character.charAt(0).toUpperCase() + character.slice(1)}: ${content}`;
+        setCharacterText(messageContent, content, character);
     } else {
         messageContent.textContent = content;
     }
 
     if (audioUrl) {
-        const audioContainer = document.createElement('div');
-        audioContainer.classList.add('audio-container');
-        const audio = document.createElement('audio');
-        audio.controls = true;
-        audio.src = audioUrl + '?t=' + new Date().getTime();
-        audioContainer.appendChild(audio);
-        messageContent.appendChild(audioContainer);
+        attachAudio(messageContent, audioUrl);
     }
 
     messageDiv.appendChild(messageContent);
-    chatMessages.appendChild(messageDiv);
+    chatMessages.insertBefore(messageDiv, beforeNode);
 
     setTimeout(() => {
         messageDiv.style.transition = 'opacity 0.5s ease';
         messageDiv.style.opacity = '1';
     }, 10);
 
-    chatMessages.scrollTop = chatMessages.scrollHeight;
+    if (!beforeNode) chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageContent;
+}
+
+function setCharacterText(messageContent, content, character = selectedCharacter) {
+    messageContent.textContent = `${character.charAt(0).toUpperCase() + character.slice(1)}: ${content}`;
+}
+
+function attachAudio(messageContent, audioUrl) {
+    const audioContainer = document.createElement('div');
+    audioContainer.classList.add('audio-container');
+    const audio = document.createElement('audio');
+    audio.controls = true;
+    // Fetched on play: a streamed reply's MP3 is still uploading when its URL arrives
+    audio.preload = 'none';
+    // Audio URLs are unique per recording or content-addressed, so they can be cached
+    audio.src = audioUrl;
+    audioContainer.appendChild(audio);
+    messageContent.appendChild(audioContainer);
+    return audio;
+}
+
+// Reads an NDJSON response from the chat endpoints and calls onEvent
+// for each stage as soon as its line arrives.
+async function readEventStream(response, onEvent) {
+    if (!response.ok) {
+        const data = await response.json();
+        throw new Error(data.error || 'An error occurred while processing the request.');
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (!line) continue;
+            const data = JSON.parse(line);
+            if (data.event === 'error') throw new Error(data.error);
+            onEvent(data);
+        }
+    }
+}
+
+// Plays streamed sentence audio back to back, in the order it arrives.
+function createChunkPlayer() {
+    const queue = [];
+    let playing = false;
+    const playNext = () => {
+        if (!queue.length) {
+            playing = false;
+            return;
+        }
+        playing = true;
+        const audio = new Audio(queue.shift());
+        audio.onended = playNext;
+        audio.onerror = playNext;
+        audio.play().catch(playNext);
+    };
+    return (base64Audio) => {
+        queue.push('data:audio/mpeg;base64,' + base64Audio);
+        if (!playing) playNext();
+    };
+}
+
+// Renders a streamed chat turn: the user's message, the character's text
+// and finally the audio, each as soon as the server emits it.
+// localAudioUrl plays the user's own recording without waiting for the server's copy.
+function renderStreamedTurn(showUserMessage, onResponse, localAudioUrl = null) {
+    let userContent = null;
+    let responseContent = null;
+    let streamedText = '';
+    let chunksPlayed = false;
+    const playChunk = createChunkPlayer();
+    return (data) => {
+        if (data.event === 'transcript' && showUserMessage) {
+            userContent = addMessage(data.transcript, true, selectedCharacter,
+                localAudioUrl || data.recorded_audio_url);
+        } else if (data.event === 'response_delta') {
+            // The server assigns the turn's id up front; once it is known, pages and
+            // deltas fetched before the 'message' event arrives skip this turn
+            knownMessageIds.add(data.message_id);
+            streamedText += data.text;
+            if (!responseContent) {
+                onResponse();
+                responseContent = addMessage(streamedText, false, data.character);
+            } else {
+                setCharacterText(responseContent, streamedText, data.character);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        } else if (data.event === 'response') {
+            knownMessageIds.add(data.message_id);
+            onResponse();
+            if (responseContent) {
+                setCharacterText(responseContent, data.response, data.character);
+            } else {
+                responseContent = addMessage(data.response, false, data.character);
+            }
+        } else if (data.event === 'audio_chunk') {
+            chunksPlayed = true;
+            playChunk(data.audio);
+        } else if (data.event === 'audio' && responseContent) {
+            const audio = attachAudio(responseContent, data.synthesized_audio_url);
+            // Cached lines arrive without chunks; play the stored reply instead
+            if (!chunksPlayed) audio.play().catch(() => {});
+        } else if (data.event === 'message') {
+            // The turn is already on screen; its cursor moves newestCursor past it
+            trackMessage(data.message);
+            // The recording may still have been uploading when the transcript was sent
+            if (userContent && data.message.recorded_audio_url && !userContent.querySelector('audio')) {
+                attachAudio(userContent, data.message.recorded_audio_url);
+            }
+        }
+    };
+}
+
+// Live transcription sends the recording in small WebM/Opus chunks while it is made
+const LIVE_MIME_TYPE = 'audio/webm;codecs=opus';
+const LIVE_CHUNK_MS = 250;
+const MAX_RECORDING_MS = 15000;
+
+// Client-side voice activity detection (when clientVad is on): recording stops by itself once
+// speech is followed by TRAILING_SILENCE_MS of quiet, and clips without speech are never uploaded
+const VAD_THRESHOLD_DB = -50;
+const TRAILING_SILENCE_MS = 1500;
+
+function watchVoiceActivity(stream, onSilence) {
+    const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+    if (!clientVad || !AudioContextClass) return { heardSpeech: () => true, stop: () => {} };
+    const context = new AudioContextClass();
+    const analyser = context.createAnalyser();
+    analyser.fftSize = 2048;
+    context.createMediaStreamSource(stream).connect(analyser);
+    const samples = new Float32Array(analyser.fftSize);
+    let heard = false;
+    let lastVoiceAt = 0;
+    const timer = setInterval(() => {
+        analyser.getFloatTimeDomainData(samples);
+        let energy = 0;
+        for (const sample of samples) energy += sample * sample;
+        const level = 10 * Math.log10(energy / samples.length + 1e-12);
+        const now = performance.now();
+        if (level > VAD_THRESHOLD_DB) {
+            heard = true;
+            lastVoiceAt = now;
+        } else if (heard && now - lastVoiceAt > TRAILING_SILENCE_MS) {
+            onSilence();
+        }
+    }, 50);
+    let stopped = false;
+    return {
+        heardSpeech: () => heard,
+        stop: () => {
+            if (stopped) return;
+            stopped = true;
+            clearInterval(timer);
+            context.close();
+        }
+    };
+}
+
+function resetRecordButton(stream) {
+    recordButton.disabled = false;
+    recordButton.dataset.recording = 'false';
+    delete recordButton.mediaRecorder;
+    recordingStatus.textContent = '';
+    recordingStatus.style.display = 'none';
+    recordButton.innerHTML = '<img src="/static/mic_button.png" alt="Record" class="button-icon">';
+    stream.getTracks().forEach(track => track.stop()); // Stop microphone access
+}
+
+// Streams microphone audio to the server while recording. Interim transcripts
+// replace the loading text as they arrive, and the reply starts as soon as the
+// server has the final transcript, which may be before recording stops.
+async function recordLive(stream, loadingDiv) {
+    const startResponse = await fetch('/live_audio', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ character: selectedCharacter, language: languageSelect.value })
+    });
+    const session = await startResponse.json();
+    if (!startResponse.ok) throw new Error(session.error || 'Could not start live transcription.');
+
+    const mediaRecorder = new MediaRecorder(stream, { mimeType: LIVE_MIME_TYPE });
+    recordButton.mediaRecorder = mediaRecorder;
+    // Chunks are posted one after another so the server receives them in order
+    let uploads = Promise.resolve();
+    const post = (path, body) => {
+        uploads = uploads.then(() => fetch(`/live_audio/${session.session_id}/${path}`, { method: 'POST', body }))
+            .catch(() => {});
+    };
+    mediaRecorder.ondataavailable = (event) => {
+        if (event.data.size > 0) post('audio', event.data);
+    };
+    const voiceActivity = watchVoiceActivity(stream, () => {
+        if (mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+    });
+    mediaRecorder.onstop = () => {
+        voiceActivity.stop();
+        post('end');
+    };
+    mediaRecorder.start(LIVE_CHUNK_MS);
+    recordingStatus.textContent = 'Recording... (Click again to stop)';
+    recordButton.disabled = false;
+    const autoStop = setTimeout(() => {
+        if (mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+    }, MAX_RECORDING_MS);
+
+    const showTurn = renderStreamedTurn(true, () => removeLoading(loadingDiv));
+    try {
+        const response = await fetch(`/live_audio/${session.session_id}/events`);
+        await readEventStream(response, (data) => {
+            if (data.event === 'interim_transcript') {
+                loadingDiv.textContent = data.transcript || 'Listening...';
+                return;
+            }
+            // The server stopped listening; the rest of the recording isn't needed
+            if (data.event === 'transcript' && mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+            showTurn(data);
+        });
+    } finally {
+        clearTimeout(autoStop);
+        if (mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+    }
 }
 
 recordButton.addEventListener('click', async function recordHandler() {
@@ -99,6 +395,20 @@ recordButton.addEventListener('click', async function recordHandler() {
 
     try {
         const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+
+        if (liveTranscription && MediaRecorder.isTypeSupported(LIVE_MIME_TYPE)) {
+            try {
+                await recordLive(stream, loadingDiv);
+            } catch (err) {
+                errorDiv.textContent = 'An error occurred: ' + err.message;
+                errorDiv.style.display = 'block';
+            } finally {
+                removeLoading(loadingDiv);
+                resetRecordButton(stream);
+            }
+            return;
+        }
+
         const mediaRecorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
         recordButton.mediaRecorder = mediaRecorder; // Store for stopping later
 
@@ -108,9 +418,20 @@ recordButton.addEventListener('click', async function recordHandler() {
             }
         };
 
+        const voiceActivity = watchVoiceActivity(stream, () => {
+            if (mediaRecorder.state !== 'inactive') mediaRecorder.stop();
+        });
+
         mediaRecorder.onstop = async () => {
+            voiceActivity.stop();
             // Update UI to "Processing"
             removeLoading(loadingDiv);
+            if (!voiceActivity.heardSpeech()) {
+                errorDiv.textContent = 'No speech detected. Please try again.';
+                errorDiv.style.display = 'block';
+                resetRecordButton(stream);
+                return;
+            }
             const processingDiv = await showLoading(false);
 
             const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
@@ -120,32 +441,19 @@ recordButton.addEventListener('click', async function recordHandler() {
             formData.append('language', languageSelect.value);
 
             try {
-                const response = await fetch('/process_audio', {
+                const response = await fetch('/process_audio?stream=1', {
                     method: 'POST',
                     body: formData
                 });
 
-                const data = await response.json();
-
-                if (response.ok) {
-                    addMessage(data.transcript, true, data.character, data.recorded_audio_url);
-                    addMessage(data.response, false, data.character, data.synthesized_audio_url);
-                } else {
-                    errorDiv.textContent = data.error || 'An error occurred while processing the audio.';
-                    errorDiv.style.display = 'block';
-                }
+                await readEventStream(response, renderStreamedTurn(true, () => removeLoading(processingDiv),
+                    URL.createObjectURL(audioBlob)));
             } catch (err) {
                 errorDiv.textContent = 'An error occurred: ' + err.message;
                 errorDiv.style.display = 'block';
             } finally {
                 removeLoading(processingDiv);
-                recordButton.disabled = false;
-                recordButton.dataset.recording = 'false';
-                delete recordButton.mediaRecorder;
-                recordingStatus.textContent = '';
-                recordingStatus.style.display = 'none';
-                recordButton.innerHTML = '<img src="/static/mic_button.png" alt="Record" class="button-icon">';
-                stream.getTracks().forEach(track => track.stop()); // Stop microphone access
+                resetRecordButton(stream);
             }
         };
 
@@ -158,7 +466,7 @@ recordButton.addEventListener('click', async function recordHandler() {
             if (mediaRecorder.state !== 'inactive') {
                 mediaRecorder.stop();
             }
-        }, 15000);
+        }, MAX_RECORDING_MS);
 
     } catch (err) {
         errorDiv.textContent = 'Microphone access denied or unavailable: ' + err.message;
@@ -182,7 +490,7 @@ sendButton.addEventListener('click', async () => {
     const loadingDiv = await showLoading();
 
     try {
-        const response = await fetch('/process_text', {
+        const response = await fetch('/process_text?stream=1', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
@@ -192,14 +500,7 @@ sendButton.addEventListener('click', async () => {
             })
         });
 
-        const data = await response.json();
-
-        if (response.ok) {
-            addMessage(data.response, false, data.character, data.synthesized_audio_url);
-        } else {
-            errorDiv.textContent = data.error || 'An error occurred while processing the text.';
-            errorDiv.style.display = 'block';
-        }
+        await readEventStream(response, renderStreamedTurn(false, () => removeLoading(loadingDiv)));
     } catch (err) {
         errorDiv.textContent = 'An error occurred: ' + err.message;
         errorDiv.style.display = 'block';
@@ -222,15 +523,36 @@ languageSelect.addEventListener('change', () => {
     }, 3000);
 });
 
+// The chat is hidden as soon as /clear_chat returns; stored messages and audio are
+// deleted afterwards, so only a failed deletion is worth telling the user about.
+const CLEAR_POLL_MS = 1000;
+
+async function watchClearJob(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, CLEAR_POLL_MS));
+        let job;
+        try {
+            const response = await fetch(`/clear_chat/${jobId}`);
+            if (!response.ok) return;
+            job = await response.json();
+        } catch (err) {
+            return;
+        }
+        if (job.status === 'failed') {
+            errorDiv.textContent = 'Some stored messages could not be deleted: ' + job.error;
+            errorDiv.style.display = 'block';
+            errorDiv.style.color = 'red';
+        }
+        if (job.status !== 'running') return;
+    }
+}
+
 clearChatButton.addEventListener('click', async () => {
     try {
         const response = await fetch('/clear_chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ 
-                ip_address: ipAddress,
-                character: selectedCharacter 
-            })
+            body: JSON.stringify({ character: selectedCharacter })
         });
 
         const data = await response.json();
@@ -241,12 +563,14 @@ clearChatButton.addEventListener('click', async () => {
                     child.remove();
                 }
             });
+            resetConversationState();
             errorDiv.textContent = 'Chat cleared successfully!';
             errorDiv.style.display = 'block';
             errorDiv.style.color = 'green';
             setTimeout(() => {
                 errorDiv.style.display = 'none';
             }, 3000);
+            if (data.job_id) watchClearJob(data.job_id);
         } else {
             errorDiv.textContent = data.error || 'Failed to clear chat.';
             errorDiv.style.display = 'block';
@@ -267,7 +591,7 @@ window.addEventListener('beforeunload', (event) => {
 
 window.addEventListener('unload', () => {
     if (!isReloading) {
-        const data = JSON.stringify({ ip_address: ipAddress, character: selectedCharacter });
+        const data = JSON.stringify({ character: selectedCharacter });
         const blob = new Blob([data], { type: 'application/json' });
         navigator.sendBeacon('/cleanup', blob);
     }
@@ -275,5 +599,11 @@ window.addEventListener('unload', () => {
 
 window.addEventListener('load', () => {
     isReloading = false;
-    syncConversation(initialConversation);
+    syncConversation(initialConversation, initialHasMore);
 });
+
+chatMessages.addEventListener('scroll', () => {
+    if (chatMessages.scrollTop < 50) loadOlderMessages();
+});
+
+window.addEventListener('focus', loadNewMessages);
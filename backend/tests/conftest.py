@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import uuid
+import types
+import tempfile
+import importlib
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# Set before any backend module reads its configuration
+SCRATCH = tempfile.mkdtemp(prefix='dallbot-tests-')
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('FIREBASE_STORAGE_BUCKET', 'test-bucket')
+os.environ['TTS_CACHE_DIR'] = os.path.join(SCRATCH, 'tts')
+os.environ['WRITE_JOURNAL_DIR'] = os.path.join(SCRATCH, 'turn_journal')
+os.environ['RETENTION_DAYS'] = '0'
+
+class _CloudClients(types.ModuleType):
+    """google.cloud stand-in whose client libraries (speech, translate, ...) are mocks"""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        module = mock.MagicMock()
+        sys.modules[f'google.cloud.{name}'] = module
+        setattr(self, name, module)
+        return module
+
+def _fake_cloud_modules():
+    google = types.ModuleType('google')
+    google.__path__ = []
+    cloud = _CloudClients('google.cloud')
+    cloud.__path__ = []
+    google.cloud = cloud
+    modules = {'google': google, 'google.cloud': cloud}
+    for name in ('firebase_admin', 'firebase_admin.credentials', 'firebase_admin.firestore',
+                 'firebase_admin.storage', 'firebase_creds', 'google_creds',
+                 'google.cloud.firestore_v1', 'google.cloud.firestore_v1.base_query',
+                 'google.auth', 'google.auth.transport', 'google.auth.transport.requests',
+                 'google.oauth2', 'google.oauth2.service_account'):
+        modules[name] = mock.MagicMock()
+    modules['firebase_admin'].firestore = modules['firebase_admin.firestore']
+    return modules
+
+@pytest.fixture(scope='session')
+def app_module():
+    """backend/app.py with Firebase and the Google Cloud clients replaced by mocks"""
+    with mock.patch.dict(sys.modules, _fake_cloud_modules()):
+        module = importlib.import_module('app')
+        yield module
+        module.turn_writer.stop()
+
+@pytest.fixture
+def client(app_module, monkeypatch, tmp_path):
+    """Test client whose reply pipeline runs for real on canned model, translation and TTS output"""
+    from audio_cache import AudioCache
+    from audio_delivery import AudioDelivery
+    monkeypatch.setattr(app_module, 'load_context', lambda conversation_id: ({}, []))
+    monkeypatch.setattr(app_module, 'refresh_summary', lambda *args: None)
+    messages = SimpleNamespace(document=lambda: SimpleNamespace(id=uuid.uuid4().hex[:20]))
+    monkeypatch.setattr(app_module, 'messages_ref', lambda db, conversation_id: messages)
+    monkeypatch.setattr(app_module, 'translate_text', lambda text, target, source_language=None: text)
+    monkeypatch.setattr(app_module, 'get_character_response', lambda *args, **kwargs: "Ask better questions.")
+    monkeypatch.setattr(app_module, 'stream_character_response',
+                        lambda *args, **kwargs: iter(["Ask better ", "questions."]))
+    monkeypatch.setattr(app_module, 'text_to_speech', lambda *args: b'full-mp3')
+    monkeypatch.setattr(app_module, 'stream_text_to_speech', lambda *args: iter([b'one', b'two']))
+    monkeypatch.setattr(app_module, 'tts_cache', AudioCache(str(tmp_path / 'tts'), max_bytes=1 << 20))
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(app_module, 'audio_delivery', AudioDelivery(mock.MagicMock(), executor, mode='cache'))
+    yield app_module.app.test_client()
+    executor.shutdown()
+
+def read_events(response):
+    """The NDJSON stages of a streamed response"""
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
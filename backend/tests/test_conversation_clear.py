@@ -0,0 +1,34 @@
+import time
+import importlib
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from audio_delivery import AudioDelivery
+
+def test_recordings_of_cleared_turns_are_deleted_even_if_uploaded_late(app_module):
+    conversation_clear = importlib.import_module('conversation_clear')
+    prefix = conversation_clear.recordings_prefix('conversation')
+    before = time.time_ns()
+    cleared_at = datetime.now(timezone.utc)
+    after = time.time_ns() + 1000
+    stored = {}
+    bucket = mock.MagicMock()
+    bucket.blob.side_effect = lambda name: mock.Mock(
+        upload_from_string=lambda data, **kwargs: stored.setdefault(name, SimpleNamespace(
+            name=name, time_created=cleared_at + timedelta(seconds=1), delete=mock.Mock())))
+    bucket.list_blobs.side_effect = lambda prefix: [blob for name, blob in stored.items() if name.startswith(prefix)]
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        delivery = AudioDelivery(bucket, executor, mode='cache')
+        # The pre-clear turn's recording is still uploading when the conversation is cleared
+        delivery.publish_later(f"{prefix}recorded_audio_{before}.wav", lambda: release.wait() and b'old', 'audio/wav')
+        delivery.publish_later(f"{prefix}recorded_audio_{after}.wav", lambda: b'new', 'audio/wav')
+        job = conversation_clear.ClearJob(mock.MagicMock(), bucket, 'conversation', cleared_at,
+                                          delivery.uploads_under(prefix))
+        executor.submit(job.run)
+        release.set()
+    assert job.status == 'done'
+    stored[f"{prefix}recorded_audio_{before}.wav"].delete.assert_called_once()
+    stored[f"{prefix}recorded_audio_{after}.wav"].delete.assert_not_called()
@@ -0,0 +1,34 @@
+import threading
+import pytest
+from ffmpeg_pool import FfmpegPool, FfmpegPoolError
+
+class StuckPool(FfmpegPool):
+    """Jobs hang until released, like an ffmpeg that ignores its timeout"""
+
+    def __init__(self, **kwargs):
+        self.release = threading.Event()
+        self.ran = []
+        super().__init__(['cat'], **kwargs)
+
+    def _run(self, proc, data):
+        self.ran.append(data)
+        self.release.wait()
+        proc.kill()
+        proc.wait()
+        return data
+
+def test_missing_binary_is_a_pool_error():
+    pool = FfmpegPool(['/nonexistent/ffmpeg'], workers=1)
+    with pytest.raises(FfmpegPoolError):
+        pool.convert(b'webm')
+
+def test_timed_out_job_is_cancelled_and_reported(monkeypatch):
+    monkeypatch.setattr('ffmpeg_pool.FFMPEG_RESULT_GRACE', 0.2)
+    pool = StuckPool(workers=1, job_timeout=0, queue_timeout=0.1)
+    pool.submit(b'first')
+    with pytest.raises(FfmpegPoolError):
+        # Queued behind the stuck job past every timeout
+        pool.convert(b'second')
+    pool.release.set()
+    pool.shutdown()
+    assert pool.ran == [b'first']
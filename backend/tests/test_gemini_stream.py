@@ -0,0 +1,56 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import gemini_api
+
+CHUNKS = [
+    {"candidates": [{"content": {"parts": [{"text": "Oh, "}], "role": "model"}}]},
+    {"candidates": [{"content": {"parts": [{"text": "you want "}, {"text": "boring mode?"}], "role": "model"}}]},
+    # Metadata-only chunks carry no text
+    {"usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 6}},
+]
+
+class StubGemini(BaseHTTPRequestHandler):
+    """streamGenerateContent?alt=sse stand-in sending CHUNKS as server-sent events"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.requests.append((self.client_address, self.path,
+                                     json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [': keep-alive comment\r\n\r\n'] + [f'data: {json.dumps(chunk)}\r\n\r\n' for chunk in CHUNKS]
+        for event in events:
+            body = event.encode('utf-8')
+            self.wfile.write(f'{len(body):x}\r\n'.encode('ascii') + body + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGemini)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/v1beta"
+    monkeypatch.setattr(gemini_api, 'GEMINI_STREAM_ENDPOINT',
+                        f"{base}/models/{gemini_api.GEMINI_MODEL}:streamGenerateContent?alt=sse")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_stream_yields_text_deltas_over_one_keep_alive_connection(stub_server):
+    first = list(gemini_api.stream_character_response("Tell me a joke", "en-US", "jax"))
+    second = list(gemini_api.stream_character_response("Another one", "en-US", "jax"))
+
+    assert first == second == ["Oh, ", "you want boring mode?"]
+    (first_client, path, payload), (second_client, _, _) = stub_server.requests
+    assert path.endswith(f':streamGenerateContent?alt=sse&key={gemini_api.api_key}')
+    assert "Tell me a joke" in payload['contents'][-1]['parts'][0]['text']
+    # The second request went over the pooled connection the first one opened
+    assert first_client == second_client
@@ -0,0 +1,37 @@
+import json
+import pytest
+from conftest import read_events
+
+CANNED_RESULTS = [
+    {"transcript": "help me", "is_final": False},
+    {"transcript": "help me plan", "is_final": False},
+    {"transcript": "Help me plan my week.", "is_final": True},
+]
+
+@pytest.fixture
+def fake_recognizer(monkeypatch, tmp_path):
+    responses = tmp_path / 'stt_responses.json'
+    responses.write_text(json.dumps(CANNED_RESULTS), encoding='utf-8')
+    monkeypatch.setattr('transcribe_audio.STT_FAKE_RESPONSES', str(responses))
+
+def test_live_audio_streams_interim_then_final_transcript_then_reply(client, fake_recognizer):
+    response = client.post('/live_audio', json={"character": "elias", "language": "en-US"})
+    assert response.status_code == 200
+    session_id = response.get_json()['session_id']
+    for chunk in (b'webm-header', b'opus-1', b'opus-2'):
+        assert client.post(f'/live_audio/{session_id}/audio', data=chunk).status_code == 204
+    assert client.post(f'/live_audio/{session_id}/end').status_code == 204
+
+    events = read_events(client.get(f'/live_audio/{session_id}/events'))
+    names = [event['event'] for event in events]
+    assert names == ['interim_transcript'] * 3 + [
+        'transcript', 'response_delta', 'response_delta', 'response', 'audio_chunk', 'audio_chunk', 'audio',
+        'message']
+    assert [event['transcript'] for event in events[:3]] == ["help me", "help me plan", "Help me plan my week."]
+    assert events[3]['transcript'] == "Help me plan my week."
+    assert events[-1]['message']['user_input'] == "Help me plan my week."
+    # The session is over once its reply has been sent
+    assert client.get(f'/live_audio/{session_id}/events').status_code == 404
+
+def test_live_audio_rejects_unknown_characters(client):
+    assert client.post('/live_audio', json={"character": "nobody"}).status_code == 400
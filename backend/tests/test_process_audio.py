@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import pytest
+from audio_convert import pcm_to_wav, TARGET_SAMPLE_RATE
+from conftest import read_events
+
+def tone_wav(seconds=1.0):
+    """A loud 440 Hz tone, which the silence trim keeps as speech"""
+    t = np.arange(int(seconds * TARGET_SAMPLE_RATE)) / TARGET_SAMPLE_RATE
+    return pcm_to_wav((np.sin(2 * np.pi * 440 * t) * 12000).astype(np.int16).tobytes())
+
+@pytest.fixture
+def transcriber(app_module, monkeypatch):
+    heard = []
+
+    def transcribe_pcm(pcm_audio, language='en-US'):
+        heard.append(len(pcm_audio))
+        return "Help me plan my week"
+    monkeypatch.setattr(app_module, 'transcribe_pcm', transcribe_pcm)
+    monkeypatch.setattr(app_module, 'ARCHIVE_RECORDINGS', False)
+    return heard
+
+def post_recording(client, **params):
+    return client.post('/process_audio', query_string=params, content_type='multipart/form-data',
+                       data={"character": "jax", "language": "en-US",
+                             "audio": (io.BytesIO(tone_wav()), 'recording.webm')})
+
+def test_streamed_upload_is_decoded_after_the_view_returns(client, transcriber):
+    events = read_events(post_recording(client, stream=1))
+    assert [event['event'] for event in events][:2] == ['transcript', 'response_delta']
+    assert events[0]['transcript'] == "Help me plan my week"
+    assert events[-1]['event'] == 'message'
+    assert transcriber and transcriber[0] > 0
+
+def test_buffered_upload_returns_one_json_body(client, transcriber):
+    response = post_recording(client)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['transcript'] == "Help me plan my week"
+    assert data['response'] == "Ask better questions."
+    assert data['message']['user_input'] == "Help me plan my week"
+
+def test_upload_without_audio_is_rejected(client):
+    response = client.post('/process_audio', data={"character": "jax", "language": "en-US"})
+    assert response.status_code == 400
@@ -0,0 +1,37 @@
+import importlib
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+def linking_db(urls):
+    """Firestore mock whose turns link to the given audio URLs"""
+    def where(filter):
+        query = mock.MagicMock()
+        query.limit.return_value.stream.return_value = iter([url for url in filter[2] if url in urls])
+        return query
+    db = mock.MagicMock()
+    db.collection_group.return_value.where.side_effect = where
+    return db
+
+def make_blob(name, updated):
+    return SimpleNamespace(name=name, updated=updated, public_url=f"https://storage/{name}",
+                           metadata=None, patch=mock.Mock(), delete=mock.Mock())
+
+def test_shared_audio_an_active_conversation_links_to_is_kept(app_module, monkeypatch):
+    retention = importlib.import_module('retention')
+    monkeypatch.setattr(retention, 'FieldFilter', lambda *args: args)
+    cutoff = datetime.now(timezone.utc)
+    stale = cutoff - 2 * retention.SHARED_AUDIO_TOUCH_INTERVAL
+    linked = make_blob('audio/tts/linked.mp3', stale)
+    orphaned = make_blob('audio/tts/orphaned.mp3', stale)
+    recent = make_blob('audio/tts/recent.mp3', cutoff + timedelta(hours=1))
+    bucket = mock.MagicMock()
+    bucket.list_blobs.return_value = SimpleNamespace(pages=[[linked, orphaned, recent]], next_page_token=None)
+    sweeper = retention.RetentionSweeper(linking_db({'/audio/tts/linked.mp3'}), bucket)
+    monkeypatch.setattr(sweeper, '_checkpoint', lambda **progress: None)
+
+    assert sweeper._sweep_shared_audio(cutoff, None) == 1
+    orphaned.delete.assert_called_once()
+    linked.delete.assert_not_called()
+    linked.patch.assert_called_once()
+    recent.delete.assert_not_called()
@@ -0,0 +1,28 @@
+from xml.dom import minidom
+import pytest
+from ssml import analyze_text_for_prosody
+
+GOLDEN = [
+    ("Hello there.", '<speak><p>Hello there.</p></speak>'),
+    ("Wait, what? It is key!",
+     '<speak><p>Wait, <break time="200ms"/>what<break time="100ms"/>? '
+     '<break time="600ms"/><mark name="breath"/>It is <emphasis level="moderate">key</emphasis>'
+     '<break time="50ms"/>!</p></speak>'),
+    ("Pi is 3.14; roughly. and more",
+     '<speak><p>Pi is 3.14; <break time="300ms"/>roughly. <break time="400ms"/>and more</p></speak>'),
+    ("Tom & <b>Jerry</b>\n\nNew paragraph.",
+     '<speak><p>Tom &amp; Jerry</p><p>New paragraph.</p></speak>'),
+    ("one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen.",
+     '<speak><p><prosody rate="95%">one two three four five six seven eight nine ten eleven twelve '
+     'thirteen fourteen fifteen sixteen</prosody>.</p></speak>'),
+    # Runs of end punctuation are voiced by their first mark and kept as written
+    ("Wait...", '<speak><p>Wait...</p></speak>'),
+    ("Wait... what?!",
+     '<speak><p>Wait... <break time="400ms"/>what<break time="100ms"/>?!</p></speak>'),
+]
+
+@pytest.mark.parametrize('source, expected', GOLDEN)
+def test_golden_output(source, expected):
+    actual = analyze_text_for_prosody(source)
+    assert actual == expected
+    minidom.parseString(actual)
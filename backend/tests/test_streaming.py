@@ -0,0 +1,74 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from conftest import read_events
+from audio_delivery import AudioDelivery
+
+def post_turn(client, **params):
+    return client.post('/process_text', query_string=params,
+                       json={"text": "Help me plan my week", "character": "victor", "language": "en-US"})
+
+def test_text_turn_streams_every_stage_as_json(client, app_module):
+    response = client.post('/process_text?stream=1', json={"text": "Help me plan my week", "character": "victor",
+                                                            "language": "en-US"})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    events = read_events(response)
+    assert [event['event'] for event in events] == [
+        'transcript', 'response_delta', 'response_delta', 'response', 'audio_chunk', 'audio_chunk', 'audio',
+        'message']
+    message = events[-1]['message']
+    assert message['response'] == "Ask better questions."
+    assert message['synthesized_audio_url'] == events[-2]['synthesized_audio_url']
+    assert isinstance(message['cursor'], int)
+    assert message['timestamp'] == app_module.from_cursor(message['cursor']).isoformat()
+    # Sent with the text, before the turn can show up in a conversation page
+    assert {event['message_id'] for event in events[1:4]} == {message['id']}
+
+def test_collected_turn_matches_streamed_stages(client):
+    response = client.post('/process_text', json={"text": "Bonjour", "character": "lila", "language": "fr-FR"})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['response'] == "Ask better questions."
+    assert data['message']['user_input'] == "Bonjour"
+
+def test_reused_line_touches_its_shared_blob(client, app_module):
+    first = post_turn(client).get_json()
+    bucket = app_module.audio_delivery.bucket
+    key = first['synthesized_audio_url'].rsplit('/', 1)[1][:-len('.mp3')]
+    assert post_turn(client).get_json()['synthesized_audio_url'] == first['synthesized_audio_url']
+    assert not bucket.blob.return_value.patch.called  # Uploaded moments ago
+
+    url, stored_at = app_module.tts_cache._urls[key]
+    app_module.tts_cache._urls[key] = (url, stored_at - app_module.SHARED_AUDIO_TOUCH_INTERVAL.total_seconds() - 1)
+    assert post_turn(client).get_json()['synthesized_audio_url'] == first['synthesized_audio_url']
+    app_module.audio_delivery.executor.submit(time.sleep, 0).result()
+    bucket.blob.assert_called_with(f"audio/tts/{key}.mp3")
+    assert bucket.blob.return_value.patch.call_count == 1
+
+def test_streamed_reply_is_uploaded_after_the_turn_in_public_mode(client, app_module, monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    uploads_may_run = threading.Event()
+    executor.submit(uploads_may_run.wait)
+    bucket = mock.MagicMock()
+    bucket.blob.return_value.public_url = 'https://storage.example/audio/tts/reply.mp3'
+    monkeypatch.setattr(app_module, 'audio_delivery', AudioDelivery(bucket, executor, mode='public'))
+
+    events = read_events(post_turn(client, stream=1))
+    assert events[-2] == {"event": "audio", "synthesized_audio_url": 'https://storage.example/audio/tts/reply.mp3'}
+    assert events[-1]['event'] == 'message'
+    assert not bucket.blob.return_value.upload_from_string.called
+    key = next(iter(app_module.tts_cache._index))
+    # Not offered for reuse before the blob exists
+    assert app_module.tts_cache.get_url(key) is None
+
+    uploads_may_run.set()
+    executor.shutdown()
+    bucket.blob.return_value.upload_from_string.assert_called_once()
+    assert app_module.tts_cache.get_url(key) == 'https://storage.example/audio/tts/reply.mp3'
+
+def test_health_reports_turn_writes(client):
+    data = client.get('/health').get_json()
+    assert data['status'] == 'healthy'
+    assert data['turn_writes']['status'] == 'ok'
@@ -0,0 +1,135 @@
+import os
+import time
+from datetime import datetime, timezone
+from unittest import mock
+from write_behind import TurnWriter
+
+def make_turn():
+    return {'character': 'victor', 'timestamp': datetime.now(timezone.utc)}
+
+def failing_db():
+    db = mock.MagicMock()
+    db.batch.return_value.commit.side_effect = RuntimeError("Firestore unavailable")
+    return db
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def crash(writer):
+    """Stop the writer thread and drop its lock without the clean-shutdown cleanup"""
+    with writer._condition:
+        writer._stopping = True
+        writer._condition.notify_all()
+    writer._thread.join()
+    writer._journal.close()
+    writer._lock.close()
+
+def test_turns_left_by_an_exited_process_are_written_once(tmp_path):
+    crashed = TurnWriter(failing_db(), journal_dir=str(tmp_path))
+    crashed.start()
+    crashed.enqueue('conversation', 'turn-1', make_turn())
+    crash(crashed)
+
+    db = mock.MagicMock()
+    writers = [TurnWriter(db, journal_dir=str(tmp_path)) for _ in range(2)]
+    for writer in writers:
+        writer.start()
+    wait_for(lambda: db.batch.return_value.commit.called)
+    for writer in writers:
+        writer.stop()
+    assert db.batch.return_value.set.call_count == 2  # The message and its conversation, once
+    assert os.listdir(tmp_path) == []
+
+def test_running_writers_keep_their_own_journals(tmp_path):
+    busy = TurnWriter(failing_db(), journal_dir=str(tmp_path))
+    busy.start()
+    busy.enqueue('conversation', 'turn-1', make_turn())
+    other = TurnWriter(mock.MagicMock(), journal_dir=str(tmp_path))
+    other.start()
+    assert other.pending_turns('conversation') == []
+    assert [turn_id for turn_id, _ in busy.pending_turns('conversation')] == ['turn-1']
+    other.stop()
+    busy.stop(timeout=0.1)
+    # The unwritten turn stays journaled for the next writer
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.jsonl')]) == 1
+
+def test_overflowed_turns_stay_readable_until_written(tmp_path, monkeypatch):
+    monkeypatch.setattr('write_behind.WRITE_QUEUE_TIMEOUT', 0.05)
+    db = failing_db()
+    writer = TurnWriter(db, journal_dir=str(tmp_path), max_pending=1)
+    writer.start()
+    for turn_id in ('turn-1', 'turn-2', 'turn-3'):
+        writer.enqueue('conversation', turn_id, make_turn())
+    assert [turn_id for turn_id, _ in writer.pending_turns('conversation')] == ['turn-1', 'turn-2', 'turn-3']
+
+    db.batch.return_value.commit.side_effect = None
+    wait_for(lambda: not writer.pending_turns('conversation'))
+    messages = db.collection.return_value.document.return_value.collection.return_value
+    assert [call.args[0] for call in messages.document.call_args_list][-3:] == ['turn-1', 'turn-2', 'turn-3']
+    writer.stop()
+
+def test_status_reports_failing_writes_until_they_succeed(tmp_path):
+    db = failing_db()
+    writer = TurnWriter(db, journal_dir=str(tmp_path))
+    writer.start()
+    writer.enqueue('conversation', 'turn-1', make_turn())
+    wait_for(lambda: writer.status()['failed_attempts'])
+    status = writer.status()
+    assert status['status'] == 'failing'
+    assert status['pending'] == 1
+    assert status['last_error'] == "Firestore unavailable"
+
+    db.batch.return_value.commit.side_effect = None
+    wait_for(lambda: writer.status()['status'] == 'ok')
+    assert writer.status()['pending'] == 0
+    writer.stop()
+
+class RecordingDB:
+    """Firestore stand-in that keeps the message ids of committed batches"""
+
+    def __init__(self):
+        self.available = False
+        self.written = []
+
+    def collection(self, name):
+        return mock.MagicMock()
+
+    def batch(self):
+        db = self
+        batch_refs = []
+
+        class Batch:
+            def set(self, ref, data, merge=False):
+                if not merge:
+                    batch_refs.append(ref)
+
+            def commit(self):
+                if not db.available:
+                    raise RuntimeError("Firestore unavailable")
+                db.written += [ref.turn_id for ref in batch_refs]
+        return Batch()
+
+def test_discard_drops_a_cleared_conversations_unwritten_turns(tmp_path, monkeypatch):
+    monkeypatch.setattr('write_behind.WRITE_QUEUE_TIMEOUT', 0.05)
+    monkeypatch.setattr('write_behind.messages_ref',
+                        lambda db, conversation_id: mock.Mock(document=lambda turn_id: mock.Mock(turn_id=turn_id)))
+    db = RecordingDB()
+    writer = TurnWriter(db, journal_dir=str(tmp_path), max_pending=1)
+    writer.start()
+    writer.enqueue('cleared', 'turn-1', make_turn())
+    writer.enqueue('cleared', 'turn-2', make_turn())  # Overflows
+    writer.enqueue('other', 'turn-3', make_turn())
+    cleared_at = datetime.now(timezone.utc)
+    writer.enqueue('cleared', 'turn-4', make_turn())
+
+    assert writer.discard('cleared', cleared_at) == 2
+    assert [turn_id for turn_id, _ in writer.pending_turns('cleared')] == ['turn-4']
+    assert [turn_id for turn_id, _ in writer.pending_turns('other')] == ['turn-3']
+
+    db.available = True
+    wait_for(lambda: not writer.status()['pending'] and not writer.status()['overflow'])
+    assert db.written == ['turn-3', 'turn-4']
+    writer.stop()
@@ -1,12 +1,12 @@
 from google.cloud import speech_v1p1beta1 as speech
 from google.cloud import translate_v2 as translate
 import os
-import wave
-import contextlib
-import tempfile
-import subprocess
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from google_creds import credentials
+from audio_convert import decode_to_pcm, pcm_duration, TARGET_SAMPLE_RATE
 
 # Load environment variables
 load_dotenv()
@@ -15,111 +15,181 @@ load_dotenv()
 speech_client = speech.SpeechClient(credentials=credentials)
 translate_client = translate.Client(credentials=credentials)
 
-def transcribe_audio(audio_file, language='en-US', retry_with_enhanced=True, convert_sample_rate=True):
+# Synchronous recognize rejects audio over a minute; longer clips are split into segments
+SYNC_MAX_SECONDS = 55
+SEGMENT_SECONDS = 50
+# Segments end at the quietest point within this many seconds of the limit
+SPLIT_SEARCH_SECONDS = 5
+_segment_executor = ThreadPoolExecutor(max_workers=int(os.getenv('STT_SEGMENT_WORKERS', '4')),
+                                       thread_name_prefix='stt')
+
+# Path to canned streaming results; when set, live transcription never calls the API
+STT_FAKE_RESPONSES = os.getenv('STT_FAKE_RESPONSES')
+
+def transcribe_audio(audio_file, language='en-US'):
     """
     Transcribe audio using Google Cloud Speech-to-Text with specified language
     
     Args:
-        audio_file: Path to audio file
+        audio_file: Path to an audio file in any format libav reads
         language: Language code to use for transcription (e.g. 'en-US', 'hi-IN')
-        retry_with_enhanced: Whether to retry with enhanced model if initial attempt fails
-        convert_sample_rate: Whether to convert sample rate to match Google's recommended rate
     
     Returns:
         transcript or None if failed
     """
     try:
-        # Get audio info and convert if needed
-        with contextlib.closing(wave.open(audio_file, 'r')) as f:
-            frames = f.getnframes()
-            rate = f.getframerate()
-            duration = frames / float(rate)
-        
-        # If needed, convert audio to 16kHz (Google's preferred sample rate)
-        working_audio_file = audio_file
-        if convert_sample_rate and rate != 16000:
-            fd, working_audio_file = tempfile.mkstemp(suffix='.wav')
-            os.close(fd)
-            
-            subprocess.call([
-                'ffmpeg', '-y', '-i', audio_file, 
-                '-ar', '16000', '-ac', '1', 
-                working_audio_file
-            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            print(f"Converted audio to 16kHz for optimal transcription")
-        
-        with open(working_audio_file, "rb") as f:
-            audio_content = f.read()
-        
-        audio = speech.RecognitionAudio(content=audio_content)
-        
-        # Configure Speech-to-Text with the user-selected language
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code=language,  # Use the selected language
+        # Decoding always yields 16 kHz mono PCM (Google's preferred format), so no header checks
+        with open(audio_file, "rb") as f:
+            pcm_audio = decode_to_pcm(f)
+        return recognize_pcm(pcm_audio, language)
+    except Exception as e:
+        print(f"Error during transcription: {str(e)}")
+        return None
+
+def transcribe_pcm(pcm_audio, language='en-US'):
+    """
+    Transcribe in-memory 16 kHz mono 16-bit PCM, e.g. from audio_convert.decode_to_pcm
+
+    Returns:
+        transcript or None if failed
+    """
+    try:
+        return recognize_pcm(pcm_audio, language)
+    except Exception as e:
+        print(f"Error during transcription: {str(e)}")
+        return None
+
+def stream_transcripts(audio_chunks, language='en-US', single_utterance=True):
+    """
+    Recognize audio while it is still being recorded.
+
+    Args:
+        audio_chunks: iterable of WebM/Opus byte chunks, as a MediaRecorder produces them
+        language: Language code to use for transcription
+        single_utterance: end recognition as soon as the speaker stops talking
+
+    Yields:
+        (transcript, is_final) for every interim and final result
+    """
+    if STT_FAKE_RESPONSES:
+        yield from fake_stream_transcripts(audio_chunks, STT_FAKE_RESPONSES)
+        return
+
+    config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+            sample_rate_hertz=48000,  # Browsers record Opus at 48 kHz
+            language_code=language,
             enable_automatic_punctuation=True,
-            model="latest_long" if duration > 60 else "command_and_search",
-            use_enhanced=True,
-            enable_word_confidence=True if duration < 60 else False,
-        )
-        
-        print(f"Transcribing with language: {language}")
-        response = speech_client.recognize(config=config, audio=audio)
-        
-        # Clean up temp file if created
-        if working_audio_file != audio_file:
-            os.remove(working_audio_file)
-            
-        if not response.results:
-            print("No speech detected in the audio.")
-            
-            # Retry with different settings if first attempt failed
-            if retry_with_enhanced and not config.use_enhanced:
-                print("Retrying with enhanced speech recognition...")
-                config.use_enhanced = True
-                response = speech_client.recognize(config=config, audio=audio)
-                if not response.results:
-                    return None
-            else:
-                return None
-
-        # Process results
-        transcript = ""
-        highest_confidence = 0
-        
+        ),
+        interim_results=True,
+        single_utterance=single_utterance,
+    )
+    requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks)
+    print(f"Streaming transcription with language: {language}")
+    for response in speech_client.streaming_recognize(config=config, requests=requests):
         for result in response.results:
             if result.alternatives:
-                current_transcript = result.alternatives[0].transcript
-                confidence = result.alternatives[0].confidence
-                
-                print(f"🎤 Partial Transcription: {current_transcript}")
-                print(f"🔍 Confidence: {confidence}")
-                
-                # Keep track of the highest confidence result
-                if confidence > highest_confidence:
-                    highest_confidence = confidence
-                    transcript = current_transcript
-                
-                # Accept high confidence result immediately
-                if confidence > 0.8:
-                    break
-        
-        if not transcript:
-            print("No valid transcription results found.")
-            return None
-        
-        print(f"🎤 Final Transcription: {transcript}")
-        print(f"✅ Confidence: {highest_confidence}")
-        print(f"🌍 Using Language: {language}")
-        
-        return transcript
-            
-    except Exception as e:
-        print(f"Error during transcription: {str(e)}")
-        if 'working_audio_file' in locals() and working_audio_file != audio_file and os.path.exists(working_audio_file):
-            os.remove(working_audio_file)
+                yield result.alternatives[0].transcript, result.is_final
+
+def fake_stream_transcripts(audio_chunks, responses_file):
+    """
+    Local stand-in for streaming_recognize: replays the canned results in
+    responses_file (a JSON list of {"transcript": ..., "is_final": ...}), one per
+    audio chunk received and the rest once the audio ends.
+    """
+    with open(responses_file, 'r', encoding='utf-8') as f:
+        responses = [(item['transcript'], bool(item.get('is_final'))) for item in json.load(f)]
+    for chunk in audio_chunks:
+        if not responses:
+            break
+        yield responses.pop(0)
+    yield from responses
+
+def split_pcm(pcm_audio, max_seconds=SEGMENT_SECONDS, search_seconds=SPLIT_SEARCH_SECONDS):
+    """
+    Cut 16 kHz mono PCM into segments of at most max_seconds, each ending at the
+    quietest 100 ms within its last search_seconds so words are rarely cut in half
+    """
+    samples = np.frombuffer(pcm_audio, dtype=np.int16)
+    max_length = int(max_seconds * TARGET_SAMPLE_RATE)
+    window = TARGET_SAMPLE_RATE // 10
+    segments = []
+    start = 0
+    while len(samples) - start > max_length:
+        search_start = start + max_length - int(search_seconds * TARGET_SAMPLE_RATE)
+        search = samples[search_start:start + max_length].astype(np.float32)
+        energy = np.square(search[:len(search) // window * window]).reshape(-1, window).sum(axis=1)
+        cut = search_start + int(np.argmin(energy)) * window + window // 2
+        segments.append(samples[start:cut].tobytes())
+        start = cut
+    segments.append(samples[start:].tobytes())
+    return segments
+
+def recognize_pcm(pcm_audio, language='en-US'):
+    """
+    Pick a recognition strategy by length: clips synchronous recognize accepts go
+    in one request; longer ones are split at quiet points and the segments are
+    recognized in parallel, then stitched back together in order.
+    """
+    duration = pcm_duration(pcm_audio)
+    if duration <= SYNC_MAX_SECONDS:
+        return recognize_segment(pcm_audio, language, model="command_and_search", word_confidence=True)
+
+    segments = split_pcm(pcm_audio)
+    print(f"Transcribing {duration:.1f}s of audio as {len(segments)} parallel segments")
+    transcripts = list(_segment_executor.map(
+        lambda segment: recognize_segment(segment, language, model="latest_long", word_confidence=False),
+        segments
+    ))
+    transcript = " ".join(part for part in transcripts if part)
+    if not transcript:
         return None
+    print(f"🎤 Final Transcription: {transcript}")
+    return transcript
+
+def recognize_segment(pcm_audio, language='en-US', model="command_and_search", word_confidence=True):
+    """
+    Run synchronous Speech-to-Text on up to a minute of 16 kHz LINEAR16 audio
+    """
+    audio = speech.RecognitionAudio(content=pcm_audio)
+
+    # Configure Speech-to-Text with the user-selected language
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=TARGET_SAMPLE_RATE,
+        language_code=language,  # Use the selected language
+        enable_automatic_punctuation=True,
+        model=model,
+        use_enhanced=True,
+        enable_word_confidence=word_confidence,
+    )
+
+    print(f"Transcribing with language: {language}")
+    response = speech_client.recognize(config=config, audio=audio)
+
+    if not response.results:
+        print("No speech detected in the audio.")
+        return None
+
+    # Each result covers the next stretch of the audio, so keep all of them in order
+    parts = []
+    for result in response.results:
+        if result.alternatives:
+            alternative = result.alternatives[0]
+            print(f"🎤 Partial Transcription: {alternative.transcript}")
+            print(f"🔍 Confidence: {alternative.confidence}")
+            parts.append(alternative.transcript.strip())
+
+    transcript = " ".join(part for part in parts if part)
+    if not transcript:
+        print("No valid transcription results found.")
+        return None
+
+    print(f"🎤 Transcription: {transcript}")
+    print(f"🌍 Using Language: {language}")
+
+    return transcript
 
 if __name__ == "__main__":
     audio_file = "test_audio.wav"  # Replace with your test file
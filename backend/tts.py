@@ -1,11 +1,21 @@
 from dotenv import load_dotenv
 import os
-from google.cloud import texttospeech
+# v1beta1 is needed for SSML mark timepoints (used to place breaths)
+from google.cloud import texttospeech_v1beta1 as texttospeech
 from google.cloud import translate_v3 as translate
 import re
 import time
-from pydub import AudioSegment
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from google_creds import credentials
+from audio_cache import AudioCache
+from retention import RETENTION_TTL, RETENTION_DAYS
+from audio_effects import apply_character_effects
+from audio_convert import encode_mp3, wav_to_pcm
+from ssml import analyze_text_for_prosody
+from voices import build_voice_registry, resolve_voice, validate_voices
 
 load_dotenv()
 
@@ -13,6 +23,33 @@ load_dotenv()
 client = texttospeech.TextToSpeechClient(credentials=credentials)
 translate_client = translate.TranslationServiceClient(credentials=credentials)
 
+# Sentences of a reply are synthesized concurrently on this pool
+TTS_SENTENCE_WORKERS = int(os.getenv("TTS_SENTENCE_WORKERS", "4"))
+_sentence_executor = ThreadPoolExecutor(max_workers=TTS_SENTENCE_WORKERS, thread_name_prefix="tts")
+# Silence inserted between sentences synthesized separately
+SENTENCE_PAUSE_MS = 250
+TTS_SAMPLE_RATE = 24000
+# Every (character, language) voice with its request protos, built once at import
+voice_registry = build_voice_registry(TTS_SAMPLE_RATE)
+# Pause inserted for each breath, and the spacing used when the API reports no breath marks
+BREATH_DURATION_MS = 300
+BREATH_INTERVAL_MS = 5000
+# With post-processing, LINEAR16 is requested, processed in memory and encoded to MP3 once.
+# Without it the API's MP3 is forwarded unchanged.
+TTS_POST_PROCESSING = os.getenv("TTS_POST_PROCESSING", "1") != "0"
+
+# Finished MP3s keyed by a hash of (text, language, character, voice, speaking rate).
+# Bump TTS_PIPELINE_VERSION whenever post-processing changes so stale audio is not reused.
+TTS_PIPELINE_VERSION = 3
+tts_cache = AudioCache(
+    os.getenv("TTS_CACHE_DIR", "cache/tts"),
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    memory_items=int(os.getenv("TTS_CACHE_MEMORY_ITEMS", "64")),
+    # Stop reusing a line nobody has replayed for almost the TTL; reused lines are
+    # touched (see SHARED_AUDIO_TOUCH_INTERVAL) so the sweep keeps their blobs
+    url_ttl=RETENTION_TTL.total_seconds() * 0.9 if RETENTION_DAYS > 0 else None
+)
+
 # Define which voices support SSML - this is a set you'll need to maintain
 # Based on your error message, it appears Chirp3-HD voices might not support SSML
 SSML_SUPPORTED_VOICES = {
@@ -21,7 +58,95 @@ SSML_SUPPORTED_VOICES = {
     # If a voice is not in this set, we'll use plain text instead of SSML
 }
 
-def translate_text(text, target_language):
+# Unicode blocks and the supported languages written in each script
+SCRIPT_LANGUAGES = [
+    (0x0041, 0x024F, ("en", "fr", "de", "es")),  # Latin
+    (0x0900, 0x097F, ("hi", "mr")),  # Devanagari
+    (0x0980, 0x09FF, ("bn",)),  # Bengali
+    (0x0A00, 0x0A7F, ("pa",)),  # Gurmukhi
+    (0x0A80, 0x0AFF, ("gu",)),  # Gujarati
+    (0x0B80, 0x0BFF, ("ta",)),  # Tamil
+    (0x0C00, 0x0C7F, ("te",)),  # Telugu
+    (0x0C80, 0x0CFF, ("kn",)),  # Kannada
+    (0x0D00, 0x0D7F, ("ml",)),  # Malayalam
+    (0x3040, 0x30FF, ("ja",)),  # Hiragana and Katakana
+    (0x4E00, 0x9FFF, ("ja",)),  # Kanji
+]
+
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2048"))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", "86400"))  # seconds
+_translation_cache = OrderedDict()  # (text, target) -> (translated_text, expires_at)
+_translation_lock = threading.Lock()
+
+def base_language(language_code):
+    """'en-US' -> 'en'"""
+    return language_code.split("-")[0].lower() if language_code else None
+
+def detect_script_languages(text):
+    """
+    Languages text could be in, judged from the script of its first letter without
+    calling the API. Returns None when there are no letters or the script is unknown.
+    """
+    for char in text:
+        if not char.isalpha():
+            continue
+        code_point = ord(char)
+        for start, end, languages in SCRIPT_LANGUAGES:
+            if start <= code_point <= end:
+                return languages
+        return None
+    return None
+
+def is_in_language(text, language, hint=None):
+    """
+    Cheap check whether text is already in language. The script decides when it
+    maps to a single language; otherwise the hint (e.g. the language the user
+    selected) decides among the languages sharing that script.
+    """
+    candidates = detect_script_languages(text)
+    if candidates is None:
+        return hint == language
+    if language not in candidates:
+        return False
+    return len(candidates) == 1 or hint == language
+
+def _cached_translation(text, target):
+    with _translation_lock:
+        entry = _translation_cache.get((text, target))
+        if entry is None:
+            return None
+        translated_text, expires_at = entry
+        if expires_at < time.monotonic():
+            del _translation_cache[(text, target)]
+            return None
+        _translation_cache.move_to_end((text, target))
+        return translated_text
+
+def _cache_translation(text, target, translated_text):
+    with _translation_lock:
+        _translation_cache[(text, target)] = (translated_text, time.monotonic() + TRANSLATION_CACHE_TTL)
+        _translation_cache.move_to_end((text, target))
+        while len(_translation_cache) > TRANSLATION_CACHE_SIZE:
+            _translation_cache.popitem(last=False)
+
+def translate_text(text, target_language, source_language=None):
+    """
+    Translate text to target_language.
+
+    Text already in the target language (see is_in_language, with
+    source_language as the hint) is returned unchanged; the API still
+    auto-detects whatever it is sent. Previous results are served from a
+    bounded TTL cache. On failure the original text is returned.
+    """
+    if not text or not text.strip():
+        return text
+    target = base_language(target_language)
+    if is_in_language(text, target, base_language(source_language)):
+        return text
+    cached = _cached_translation(text, target)
+    if cached is not None:
+        return cached
+
     try:
         parent = f"projects/{os.getenv('GOOGLE_CLOUD_PROJECT')}/locations/global"
         response = translate_client.translate_text(
@@ -34,244 +159,75 @@ def translate_text(text, target_language):
         )
         translated_text = response.translations[0].translated_text
         print(f"Translated text: {translated_text}")
+        _cache_translation(text, target, translated_text)
         return translated_text
     except Exception as e:
         print(f"Translation failed: {str(e)}")
         return text
 
-def analyze_text_for_prosody(text):
+def breath_splice_points(num_samples, sample_rate, breath_times=None, interval_ms=BREATH_INTERVAL_MS):
     """
-    Analyzes text and adds SSML markup for natural prosody including:
-    - Pauses at commas, periods
-    - Pitch changes for questions and exclamations (using prosody tags)
-    - Natural emphasis on important words
-    - Breathing patterns
+    Sample offsets where breaths go: the <mark name="breath"/> timepoints reported
+    by the API when there are any, otherwise every interval_ms. Offsets at the very
+    start or end are dropped.
     """
-    # First clean up any existing SSML tags to avoid conflicts
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Add paragraph breaks for better phrasing
-    text = re.sub(r'\n\s*\n', '\n</p><p>\n', text)
-    text = f"<p>{text}</p>" if not text.startswith('<p>') else text
-    
-    # Add prosodic pauses for punctuation
-    text = re.sub(r',\s*', ', <break time="200ms"/>', text)
-    text = re.sub(r';\s*', '; <break time="300ms"/>', text)
-    text = re.sub(r':\s*', ': <break time="250ms"/>', text)
-    text = re.sub(r'\.\s+', '. <break time="400ms"/>', text)
-    
-    # Add emphasis to important words (common emphasis patterns)
-    emphasis_words = ['must', 'critical', 'important', 'necessary', 'essential', 'key', 'vital']
-    for word in emphasis_words:
-        text = re.sub(rf'\b{word}\b', f'<emphasis level="moderate">{word}</emphasis>', text, flags=re.IGNORECASE)
-    
-    # Add vocal variety for questions and exclamations
-    # Note: Using rate changes instead of pitch for broader compatibility
-    questions = re.findall(r'[^.!?]*\?\s*', text)
-    for q in questions:
-        if q:
-            # Instead of pitch change, use rate change for questions
-            enhanced_q = q.replace('?', '<break time="100ms"/>?<break time="500ms"/>')
-            text = text.replace(q, enhanced_q)
-    
-    exclamations = re.findall(r'[^.!?]*!\s*', text)
-    for e in exclamations:
-        if e:
-            # Instead of pitch change, use rate and volume changes for exclamations
-            enhanced_e = e.replace('!', '<break time="50ms"/>!<break time="500ms"/>')
-            text = text.replace(e, enhanced_e)
-    
-    # Add breathing sounds at natural points
-    text = re.sub(r'([.!?])\s+([A-Z])', r'\1 <break time="600ms"/><mark name="breath"/>\2', text)
-    
-    # Adjust speed for longer sentences (slowing down slightly for clarity)
-    sentences = re.findall(r'[^.!?]*[.!?]', text)
-    for s in sentences:
-        word_count = len(s.split())
-        if word_count > 15:  # For longer sentences
-            enhanced_s = f'<prosody rate="95%">{s}</prosody>'
-            text = text.replace(s, enhanced_s)
-    
-    # Wrap in speak tags for proper SSML
-    text = f'<speak>{text}</speak>'
-    
-    # Remove duplicate or nested SSML tags
-    text = text.replace('<speak><speak>', '<speak>')
-    text = text.replace('</speak></speak>', '</speak>')
-    
-    return text
+    if breath_times:
+        points = sorted({int(round(seconds * sample_rate)) for seconds in breath_times})
+    else:
+        interval = interval_ms * sample_rate // 1000
+        points = range(interval, num_samples, interval)
+    return [point for point in points if 0 < point < num_samples]
 
-def add_dynamic_audio_effects(audio_segment, character="jax"):
+def add_natural_breathing(samples, sample_rate, breath_times=None):
     """
-    Add character-specific audio effects to make the TTS more natural and unique
+    Add natural breathing pauses to int16 samples.
+
+    All splice points are known up front, so the output is allocated once and each
+    stretch of speech is copied into place exactly once.
     """
-    # Character-specific audio profiles
-    character_profiles = {
-        "jax": {"bass": 2.0, "treble": 1.0, "clarity": 1.5},
-        "viktor": {"bass": 3.0, "treble": 0.8, "clarity": 1.2},
-        "lila": {"bass": 0.8, "treble": 1.4, "clarity": 1.8},
-        "elias": {"bass": 1.5, "treble": 1.2, "clarity": 1.3}
-    }
-    
-    profile = character_profiles.get(character, character_profiles["jax"])
-    
-    # Apply bass boost
-    if profile["bass"] > 1.0:
-        # Simple equalization for bass frequencies (approximately 60-250Hz)
-        filtered = audio_segment.low_pass_filter(250)
-        filtered = filtered.apply_gain(profile["bass"] - 1.0)
-        audio_segment = audio_segment.overlay(filtered)
-    
-    # Apply treble enhancement
-    if profile["treble"] > 1.0:
-        # Simple equalization for treble frequencies (approximately 2000-8000Hz)
-        filtered = audio_segment.high_pass_filter(2000)
-        filtered = filtered.apply_gain(profile["treble"] - 1.0)
-        audio_segment = audio_segment.overlay(filtered)
-    
-    # Apply clarity enhancement through subtle compression
-    if profile["clarity"] > 1.0:
-        # Normalization to improve clarity
-        audio_segment = audio_segment.normalize(headroom=0.1)
-    
-    # Add very subtle room ambience to make it sound less sterile
-    room_noise = AudioSegment.silent(duration=len(audio_segment))
-    room_noise = room_noise.overlay(
-        AudioSegment.silent(duration=len(audio_segment)).apply_gain(-45)  # Reduced from -30 to -45 for subtlety
-    )
-    audio_segment = audio_segment.overlay(room_noise)
-    
-    return audio_segment
+    # A breath 25 dB below digital silence is still silence, so breaths are the
+    # zeros the buffer starts with (could be replaced with a pre-recorded breath sound)
+    breath_length = BREATH_DURATION_MS * sample_rate // 1000
+    points = breath_splice_points(len(samples), sample_rate, breath_times)
+    if not points:
+        return samples
+
+    output = np.zeros(len(samples) + len(points) * breath_length, dtype=samples.dtype)
+    source_start = 0
+    for index, point in enumerate(points + [len(samples)]):
+        target_start = source_start + index * breath_length
+        output[target_start:target_start + point - source_start] = samples[source_start:point]
+        source_start = point
+    return output
 
-def add_natural_breathing(audio_segment):
+def get_voice(character, language_code):
     """
-    Add natural breathing sounds at marked positions
+    Return the prebuilt Voice (name, gender, speaking rate and request protos)
+    for a character in a language
     """
-    # Create a simple breath sound (could be replaced with a pre-recorded breath sound)
-    breath_duration = 300  # ms
-    breath = AudioSegment.silent(duration=breath_duration)
-    # Add a subtle breath sound
-    breath = breath.apply_gain(-25)  # Very quiet breath
-    
-    # Create a new audio segment with breaths inserted at appropriate points
-    new_audio = AudioSegment.empty()
-    current_position = 0
-    
-    # In a real implementation, you would identify the markers and insert breaths
-    # For now, we'll add subtle breaths at regular intervals (every ~5 seconds)
-    interval = 5000  # ms
-    
-    while current_position < len(audio_segment):
-        chunk_duration = min(interval, len(audio_segment) - current_position)
-        chunk = audio_segment[current_position:current_position + chunk_duration]
-        new_audio += chunk
-        
-        if current_position + chunk_duration < len(audio_segment):
-            # Only add breath if we're not at the end
-            new_audio += breath
-        
-        current_position += chunk_duration
-    
-    return new_audio
+    return resolve_voice(voice_registry, character, language_code)
+
+def validate_characters(characters):
+    """Fail at startup unless every character has voices of its own"""
+    validate_voices(voice_registry, characters)
 
-def text_to_speech(text, language_code, character="jax", output_file="output.mp3"):
+def synthesize_audio(text, language_code, character="jax",
+                     audio_encoding=texttospeech.AudioEncoding.MP3):
+    """
+    Run a single synthesize_speech call for text.
+
+    Returns:
+        (audio_content, enhance, breath_times) where audio_content is the audio returned
+        by the API in audio_encoding (LINEAR16 comes with a WAV header), enhance is False
+        when the plain-text fallback was used and the audio should be passed through
+        without post-processing, and breath_times are the offsets in seconds of the
+        <mark name="breath"/> tags (empty for plain text)
+    """
     # Use the full language_code (e.g., "en-US") instead of splitting
-    full_language_code = language_code  # e.g., "en-US", "hi-IN"
-    
-    # Define voice settings for each character with updated Chirp3-HD voices
-    voice_settings = {
-        "jax": {
-            "name": (
-                "hi-IN-Chirp3-HD-Fenrir" if full_language_code == "hi-IN" else
-                "ta-IN-Chirp3-HD-Fenrir" if full_language_code == "ta-IN" else
-                "kn-IN-Chirp3-HD-Fenrir" if full_language_code == "kn-IN" else
-                "te-IN-Chirp3-HD-Fenrir" if full_language_code == "te-IN" else
-                "ml-IN-Chirp3-HD-Fenrir" if full_language_code == "ml-IN" else
-                "bn-IN-Chirp3-HD-Fenrir" if full_language_code == "bn-IN" else
-                "mr-IN-Chirp3-HD-Fenrir" if full_language_code == "mr-IN" else
-                "gu-IN-Chirp3-HD-Fenrir" if full_language_code == "gu-IN" else
-                "pa-IN-Wavenet-B" if full_language_code == "pa-IN" else
-                "ja-JP-Chirp3-HD-Fenrir" if full_language_code == "ja-JP" else
-                "fr-FR-Chirp3-HD-Fenrir" if full_language_code == "fr-FR" else
-                "de-DE-Chirp3-HD-Fenrir" if full_language_code == "de-DE" else
-                "es-US-Chirp3-HD-Fenrir" if full_language_code == "es-US" else  # Mapping es-ES to es-US voice
-                "en-US-Chirp3-HD-Fenrir" if full_language_code == "en-US" else
-                "en-US-Chirp3-HD-Fenrir"  # Default fallback
-            ),
-            "gender": texttospeech.SsmlVoiceGender.MALE,
-            "speaking_rate": 0.95
-        },
-        "viktor": {
-            "name": (
-                "hi-IN-Chirp3-HD-Puck" if full_language_code == "hi-IN" else
-                "ta-IN-Chirp3-HD-Orus" if full_language_code == "ta-IN" else
-                "kn-IN-Chirp3-HD-Orus" if full_language_code == "kn-IN" else
-                "te-IN-Chirp3-HD-Puck" if full_language_code == "te-IN" else
-                "ml-IN-Chirp3-HD-Puck" if full_language_code == "ml-IN" else
-                "bn-IN-Chirp3-HD-Puck" if full_language_code == "bn-IN" else
-                "mr-IN-Chirp3-HD-Puck" if full_language_code == "mr-IN" else
-                "gu-IN-Chirp3-HD-Puck" if full_language_code == "gu-IN" else
-                "pa-IN-Wavenet-D" if full_language_code == "pa-IN" else
-                "ja-JP-Chirp3-HD-Charon" if full_language_code == "ja-JP" else
-                "fr-FR-Chirp3-HD-Puck" if full_language_code == "fr-FR" else
-                "de-DE-Chirp3-HD-Puck" if full_language_code == "de-DE" else
-                "es-US-Chirp-HD-D" if full_language_code == "es-US" else
-                "en-US-Chirp3-HD-Puck" if full_language_code == "en-US" else
-                "en-US-Chirp3-HD-Puck"  # Default fallback
-            ),
-            "gender": texttospeech.SsmlVoiceGender.MALE,
-            "speaking_rate": 0.9
-        },
-        "lila": {
-            "name": (
-                "hi-IN-Chirp3-HD-Aoede" if full_language_code == "hi-IN" else
-                "ta-IN-Chirp3-HD-Leda" if full_language_code == "ta-IN" else
-                "kn-IN-Chirp3-HD-Leda" if full_language_code == "kn-IN" else
-                "te-IN-Chirp3-HD-Aoede" if full_language_code == "te-IN" else
-                "ml-IN-Chirp3-HD-Aoede" if full_language_code == "ml-IN" else
-                "bn-IN-Chirp3-HD-Aoede" if full_language_code == "bn-IN" else
-                "mr-IN-Chirp3-HD-Aoede" if full_language_code == "mr-IN" else
-                "gu-IN-Chirp3-HD-Aoede" if full_language_code == "gu-IN" else
-                "pa-IN-Wavenet-A" if full_language_code == "pa-IN" else
-                "ja-JP-Chirp3-HD-Aoede" if full_language_code == "ja-JP" else
-                "fr-FR-Chirp3-HD-Aoede" if full_language_code == "fr-FR" else
-                "de-DE-Chirp3-HD-Aoede" if full_language_code == "de-DE" else
-                "es-US-Chirp-HD-F" if full_language_code == "es-US" else
-                "en-US-Chirp3-HD-Aoede" if full_language_code == "en-US" else
-                "en-US-Chirp3-HD-Aoede"  # Default fallback
-            ),
-            "gender": texttospeech.SsmlVoiceGender.FEMALE,
-            "speaking_rate": 1.0
-        },
-        "elias": {
-            "name": (
-                "hi-IN-Chirp3-HD-Charon" if full_language_code == "hi-IN" else
-                "ta-IN-Chirp3-HD-Charon" if full_language_code == "ta-IN" else
-                "kn-IN-Chirp3-HD-Charon" if full_language_code == "kn-IN" else
-                "te-IN-Chirp3-HD-Charon" if full_language_code == "te-IN" else
-                "ml-IN-Chirp3-HD-Charon" if full_language_code == "ml-IN" else
-                "bn-IN-Chirp3-HD-Charon" if full_language_code == "bn-IN" else
-                "mr-IN-Chirp3-HD-Charon" if full_language_code == "mr-IN" else
-                "gu-IN-Chirp3-HD-Charon" if full_language_code == "gu-IN" else
-                "pa-IN-Wavenet-D" if full_language_code == "pa-IN" else
-                "ja-JP-Chirp3-HD-Charon" if full_language_code == "ja-JP" else
-                "fr-FR-Chirp3-HD-Charon" if full_language_code == "fr-FR" else
-                "de-DE-Chirp3-HD-Charon" if full_language_code == "de-DE" else
-                "es-US-Chirp3-HD-Charon" if full_language_code == "es-US" else
-                "en-US-Chirp3-HD-Charon" if full_language_code == "en-US" else
-                "en-US-Chirp3-HD-Charon"  # Default fallback
-            ),
-            "gender": texttospeech.SsmlVoiceGender.MALE,
-            "speaking_rate": 0.92
-        }
-    }
-    voice_params = voice_settings.get(character, voice_settings["jax"])
-    
-    # Get the selected voice name
-    voice_name = voice_params["name"]
+    voice = get_voice(character, language_code)
     
     # Check if the voice supports SSML
-    supports_ssml = voice_name in SSML_SUPPORTED_VOICES
+    supports_ssml = voice.name in SSML_SUPPORTED_VOICES
     
     try:
         # If the voice supports SSML, use prosodic text, otherwise use plain text
@@ -285,42 +241,19 @@ def text_to_speech(text, language_code, character="jax", output_file="output.mp3
             print(f"Using plain text for TTS (voice doesn't support SSML): {clean_text}")
             synthesis_input = texttospeech.SynthesisInput(text=clean_text)
         
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=full_language_code,
-            name=voice_name,
-            ssml_gender=voice_params["gender"]
+        print(f"Using Google Cloud TTS with language: {voice.language_code}, voice: {voice.name}")
+        request = texttospeech.SynthesizeSpeechRequest(
+            input=synthesis_input,
+            voice=voice.selection,
+            # Enhanced audio config with better quality
+            audio_config=voice.audio_configs[(audio_encoding, True)],
+            # Ask for the offsets of the SSML marks so breaths land where the text put them
+            enable_time_pointing=[texttospeech.SynthesizeSpeechRequest.TimepointType.SSML_MARK] if supports_ssml else []
         )
-        
-        # Enhanced audio config with better quality
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=voice_params["speaking_rate"],
-            effects_profile_id=["headphone-class-device"],  # Higher quality audio profile
-            sample_rate_hertz=24000  # Higher sample rate for better clarity
-        )
-
-        print(f"Using Google Cloud TTS with language: {full_language_code}, voice: {voice_name}")
-        response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-
-        temp_file = f"temp_output_{time.time()}.mp3"
-        with open(temp_file, "wb") as out:
-            out.write(response.audio_content)
-
-        # Load with pydub for additional audio processing
-        audio = AudioSegment.from_mp3(temp_file)
-        
-        # Add character-specific audio effects
-        audio = add_dynamic_audio_effects(audio, character)
-        
-        # Add natural breathing sounds
-        audio = add_natural_breathing(audio)
-        
-        # Export the enhanced audio
-        audio.export(output_file, format="mp3", bitrate="192k")
-        
-        os.remove(temp_file)
-        print(f"Enhanced TTS audio saved to {output_file} for character: {character} in language: {language_code}")
-        return True
+        response = client.synthesize_speech(request=request)
+        breath_times = [timepoint.time_seconds for timepoint in response.timepoints
+                        if timepoint.mark_name == "breath"]
+        return response.audio_content, True, breath_times
     except Exception as e:
         print(f"Google Cloud TTS error: {str(e)}")
         
@@ -333,29 +266,142 @@ def text_to_speech(text, language_code, character="jax", output_file="output.mp3
                 synthesis_input = texttospeech.SynthesisInput(text=clean_text)
                 
                 # Simpler audio config
-                audio_config = texttospeech.AudioConfig(
-                    audio_encoding=texttospeech.AudioEncoding.MP3,
-                    speaking_rate=voice_params["speaking_rate"]
-                )
-                
-                response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-                
-                with open(output_file, "wb") as out:
-                    out.write(response.audio_content)
-                
-                print(f"Fallback TTS audio saved to {output_file}")
-                return True
+                response = client.synthesize_speech(input=synthesis_input, voice=voice.selection,
+                                                    audio_config=voice.audio_configs[(audio_encoding, False)])
+                return response.audio_content, False, []
             except Exception as fallback_error:
                 print(f"Fallback TTS also failed: {str(fallback_error)}")
         
         raise ValueError(f"Failed to generate speech for {language_code}")
 
+def render_audio(text, language_code, character="jax", breathing=True):
+    """
+    Synthesize text and apply the character's post-processing, returning MP3 bytes.
+
+    The audio is decoded and encoded at most once: LINEAR16 from the API is
+    processed as a NumPy array and encoded straight to MP3 in memory. With
+    TTS_POST_PROCESSING off, the API's MP3 is returned untouched.
+    """
+    if not TTS_POST_PROCESSING:
+        audio_content, _, _ = synthesize_audio(text, language_code, character)
+        return audio_content
+
+    audio_content, enhance, breath_times = synthesize_audio(text, language_code, character,
+                                              texttospeech.AudioEncoding.LINEAR16)
+    pcm, sample_rate = wav_to_pcm(audio_content)
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    if enhance:
+        # Add character-specific audio effects
+        samples = apply_character_effects(samples, sample_rate, character)
+
+        # Add natural breathing sounds
+        if breathing:
+            samples = add_natural_breathing(samples, sample_rate, breath_times)
+    return encode_mp3(samples, sample_rate)
+
+def tts_cache_key(text, language_code, character="jax", variant="full"):
+    """
+    Content address of the finished audio for this text, language and character.
+    variant separates whole replies ("full"), joined sentence streams
+    ("incremental") and single sentences ("sentence").
+    """
+    voice = get_voice(character, language_code)
+    return tts_cache.make_key(
+        TTS_PIPELINE_VERSION,
+        variant,
+        text,
+        language_code,
+        character,
+        voice.name,
+        voice.speaking_rate,
+        TTS_POST_PROCESSING
+    )
+
+def text_to_speech(text, language_code, character="jax", output_file=None, incremental=False):
+    """
+    Synthesize text and return the MP3 bytes, also writing them to output_file if given.
+
+    With incremental=True the reply is split into sentences that are synthesized
+    concurrently and joined in order (see stream_text_to_speech). Finished audio
+    is served from tts_cache when the same line was synthesized before.
+    """
+    if incremental:
+        audio_content = join_sentence_audio(stream_text_to_speech(text, language_code, character))
+        if output_file:
+            with open(output_file, "wb") as out:
+                out.write(audio_content)
+        return audio_content
+
+    cache_key = tts_cache_key(text, language_code, character)
+    audio_content = tts_cache.get(cache_key)
+    if audio_content is None:
+        audio_content = render_audio(text, language_code, character)
+        tts_cache.put(cache_key, audio_content)
+        print(f"Enhanced TTS audio generated for character: {character} in language: {language_code}")
+    else:
+        print(f"TTS cache hit for character: {character} in language: {language_code}")
+
+    if output_file:
+        with open(output_file, "wb") as out:
+            out.write(audio_content)
+        print(f"TTS audio saved to {output_file}")
+    return audio_content
+
+def render_sentence(sentence, language_code, character="jax"):
+    """
+    Finished MP3 bytes for a single sentence, from tts_cache when possible
+    """
+    cache_key = tts_cache_key(sentence, language_code, character, variant="sentence")
+    audio_content = tts_cache.get(cache_key)
+    if audio_content is None:
+        audio_content = render_audio(sentence, language_code, character, breathing=False)
+        tts_cache.put(cache_key, audio_content)
+    return audio_content
+
+def stream_text_to_speech(text, language_code, character="jax"):
+    """
+    Synthesize a reply sentence by sentence.
+
+    Every sentence is submitted to the TTS pool up front, and the MP3 bytes of each
+    one are yielded in order as soon as it is ready, so playback can start after
+    the first sentence instead of the whole reply.
+    """
+    sentences = [sentence for sentence, _ in detect_sentence_boundaries(text)] or [text]
+    futures = [
+        _sentence_executor.submit(render_sentence, sentence, language_code, character)
+        for sentence in sentences
+    ]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def join_sentence_audio(chunks):
+    """
+    Join per-sentence MP3s with a short pause. MP3 is a sequence of self-contained
+    frames, so sentences can be joined without decoding them again.
+    """
+    return _sentence_pause_mp3().join(chunks)
+
+_pause_mp3 = None
+
+def _sentence_pause_mp3():
+    global _pause_mp3
+    if _pause_mp3 is None:
+        silence = np.zeros(SENTENCE_PAUSE_MS * TTS_SAMPLE_RATE // 1000, dtype=np.int16)
+        _pause_mp3 = encode_mp3(silence, TTS_SAMPLE_RATE)
+    return _pause_mp3
+
 def detect_sentence_boundaries(text):
     """
     Detect sentence boundaries and return a list of sentences with their punctuation type
     """
-    # This regex captures sentences ending with ., !, or ? with any trailing spaces
-    sentence_pattern = re.compile(r'[^.!?]+[.!?](?:\s+|$)')
+    # This regex captures sentences ending with ., !, or ? with any trailing spaces.
+    # Punctuation followed directly by a non-space (e.g. "3.14") does not end a sentence,
+    # and trailing text without final punctuation is kept as its own sentence.
+    sentence_pattern = re.compile(r'(?:[^.!?]|[.!?](?=\S))+[.!?]*(?:\s+|$)')
     sentences = sentence_pattern.findall(text)
     
     result = []
@@ -371,7 +417,7 @@ if __name__ == "__main__":
     # Base English messages tailored to each character
     character_tests = {
         "jax": "Hey Jax, roast me while telling me how to cook pasta! Make sure you explain all the steps clearly.",
-        "viktor": "Viktor, how do I fix my car? It's making a strange noise when I brake. Is this serious?",
+        "victor": "Victor, how do I fix my car? It's making a strange noise when I brake. Is this serious?",
         "lila": "Lila, can you help me pick an outfit? I have a job interview tomorrow, and I want to make a good impression.",
         "elias": "Elias, how do I make a tough decision? I'm stuck between two job offers, and I'm not sure which one to choose."
     }
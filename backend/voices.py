@@ -0,0 +1,167 @@
+import os
+import json
+from collections import namedtuple
+# v1beta1 to match the TTS client in tts.py
+from google.cloud import texttospeech_v1beta1 as texttospeech
+
+DEFAULT_CHARACTER = "jax"
+DEFAULT_LANGUAGE = "en-US"
+# Optional JSON file adding or overriding characters and languages, in the same shape as VOICE_TABLE
+TTS_VOICES_FILE = os.getenv("TTS_VOICES_FILE")
+
+# Voice name per language for each character
+VOICE_TABLE = {
+    "jax": {
+        "gender": "MALE",
+        "speaking_rate": 0.95,
+        "voices": {
+            "hi-IN": "hi-IN-Chirp3-HD-Fenrir",
+            "ta-IN": "ta-IN-Chirp3-HD-Fenrir",
+            "kn-IN": "kn-IN-Chirp3-HD-Fenrir",
+            "te-IN": "te-IN-Chirp3-HD-Fenrir",
+            "ml-IN": "ml-IN-Chirp3-HD-Fenrir",
+            "bn-IN": "bn-IN-Chirp3-HD-Fenrir",
+            "mr-IN": "mr-IN-Chirp3-HD-Fenrir",
+            "gu-IN": "gu-IN-Chirp3-HD-Fenrir",
+            "pa-IN": "pa-IN-Wavenet-B",
+            "ja-JP": "ja-JP-Chirp3-HD-Fenrir",
+            "fr-FR": "fr-FR-Chirp3-HD-Fenrir",
+            "de-DE": "de-DE-Chirp3-HD-Fenrir",
+            "es-US": "es-US-Chirp3-HD-Fenrir",  # Mapping es-ES to es-US voice
+            "en-US": "en-US-Chirp3-HD-Fenrir"
+        }
+    },
+    "victor": {
+        "gender": "MALE",
+        "speaking_rate": 0.9,
+        "voices": {
+            "hi-IN": "hi-IN-Chirp3-HD-Puck",
+            "ta-IN": "ta-IN-Chirp3-HD-Orus",
+            "kn-IN": "kn-IN-Chirp3-HD-Orus",
+            "te-IN": "te-IN-Chirp3-HD-Puck",
+            "ml-IN": "ml-IN-Chirp3-HD-Puck",
+            "bn-IN": "bn-IN-Chirp3-HD-Puck",
+            "mr-IN": "mr-IN-Chirp3-HD-Puck",
+            "gu-IN": "gu-IN-Chirp3-HD-Puck",
+            "pa-IN": "pa-IN-Wavenet-D",
+            "ja-JP": "ja-JP-Chirp3-HD-Charon",
+            "fr-FR": "fr-FR-Chirp3-HD-Puck",
+            "de-DE": "de-DE-Chirp3-HD-Puck",
+            "es-US": "es-US-Chirp-HD-D",
+            "en-US": "en-US-Chirp3-HD-Puck"
+        }
+    },
+    "lila": {
+        "gender": "FEMALE",
+        "speaking_rate": 1.0,
+        "voices": {
+            "hi-IN": "hi-IN-Chirp3-HD-Aoede",
+            "ta-IN": "ta-IN-Chirp3-HD-Leda",
+            "kn-IN": "kn-IN-Chirp3-HD-Leda",
+            "te-IN": "te-IN-Chirp3-HD-Aoede",
+            "ml-IN": "ml-IN-Chirp3-HD-Aoede",
+            "bn-IN": "bn-IN-Chirp3-HD-Aoede",
+            "mr-IN": "mr-IN-Chirp3-HD-Aoede",
+            "gu-IN": "gu-IN-Chirp3-HD-Aoede",
+            "pa-IN": "pa-IN-Wavenet-A",
+            "ja-JP": "ja-JP-Chirp3-HD-Aoede",
+            "fr-FR": "fr-FR-Chirp3-HD-Aoede",
+            "de-DE": "de-DE-Chirp3-HD-Aoede",
+            "es-US": "es-US-Chirp-HD-F",
+            "en-US": "en-US-Chirp3-HD-Aoede"
+        }
+    },
+    "elias": {
+        "gender": "MALE",
+        "speaking_rate": 0.92,
+        "voices": {
+            "hi-IN": "hi-IN-Chirp3-HD-Charon",
+            "ta-IN": "ta-IN-Chirp3-HD-Charon",
+            "kn-IN": "kn-IN-Chirp3-HD-Charon",
+            "te-IN": "te-IN-Chirp3-HD-Charon",
+            "ml-IN": "ml-IN-Chirp3-HD-Charon",
+            "bn-IN": "bn-IN-Chirp3-HD-Charon",
+            "mr-IN": "mr-IN-Chirp3-HD-Charon",
+            "gu-IN": "gu-IN-Chirp3-HD-Charon",
+            "pa-IN": "pa-IN-Wavenet-D",
+            "ja-JP": "ja-JP-Chirp3-HD-Charon",
+            "fr-FR": "fr-FR-Chirp3-HD-Charon",
+            "de-DE": "de-DE-Chirp3-HD-Charon",
+            "es-US": "es-US-Chirp3-HD-Charon",
+            "en-US": "en-US-Chirp3-HD-Charon"
+        }
+    }
+}
+
+# Everything synthesize_speech needs for one character in one language, built once.
+# audio_configs maps (audio_encoding, enhanced) to a ready AudioConfig.
+Voice = namedtuple("Voice", "character language_code name gender speaking_rate selection audio_configs")
+
+AUDIO_ENCODINGS = (texttospeech.AudioEncoding.MP3, texttospeech.AudioEncoding.LINEAR16)
+
+def load_voice_table(path=TTS_VOICES_FILE):
+    """VOICE_TABLE merged with the characters and languages from the config file, if any"""
+    table = {
+        character: dict(settings, voices=dict(settings["voices"]))
+        for character, settings in VOICE_TABLE.items()
+    }
+    if not path:
+        return table
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    for character, settings in overrides.items():
+        entry = table.setdefault(character, {"gender": "NEUTRAL", "speaking_rate": 1.0, "voices": {}})
+        entry.update({key: value for key, value in settings.items() if key != "voices"})
+        entry["voices"].update(settings.get("voices", {}))
+    print(f"Loaded voice overrides for {sorted(overrides)} from {path}")
+    return table
+
+def _build_voice(character, language_code, name, settings, sample_rate):
+    gender = texttospeech.SsmlVoiceGender[settings["gender"]]
+    audio_configs = {}
+    for encoding in AUDIO_ENCODINGS:
+        audio_configs[(encoding, True)] = texttospeech.AudioConfig(
+            audio_encoding=encoding,
+            speaking_rate=settings["speaking_rate"],
+            effects_profile_id=["headphone-class-device"],  # Higher quality audio profile
+            sample_rate_hertz=sample_rate  # Higher sample rate for better clarity
+        )
+        # Simpler config for the plain-text fallback
+        audio_configs[(encoding, False)] = texttospeech.AudioConfig(
+            audio_encoding=encoding,
+            speaking_rate=settings["speaking_rate"],
+            sample_rate_hertz=sample_rate
+        )
+    selection = texttospeech.VoiceSelectionParams(language_code=language_code, name=name, ssml_gender=gender)
+    return Voice(character, language_code, name, gender, settings["speaking_rate"], selection, audio_configs)
+
+def build_voice_registry(sample_rate, table=None):
+    """Index every (character, language) pair in the voice table to a prebuilt Voice"""
+    table = load_voice_table() if table is None else table
+    registry = {}
+    for character, settings in table.items():
+        for language_code, name in settings["voices"].items():
+            registry[(character, language_code)] = _build_voice(character, language_code, name, settings, sample_rate)
+        if (character, DEFAULT_LANGUAGE) not in registry:
+            raise ValueError(f"Voice table has no {DEFAULT_LANGUAGE} voice for {character}")
+    return registry
+
+def resolve_voice(registry, character, language_code):
+    """
+    Voice for a character in a language, falling back to the character's
+    DEFAULT_LANGUAGE voice for unknown languages and to DEFAULT_CHARACTER for
+    unknown characters
+    """
+    voice = registry.get((character, language_code))
+    if voice is None:
+        voice = registry.get((character, DEFAULT_LANGUAGE))
+    if voice is None:
+        voice = registry.get((DEFAULT_CHARACTER, language_code)) or registry[(DEFAULT_CHARACTER, DEFAULT_LANGUAGE)]
+    return voice
+
+def validate_voices(registry, characters):
+    """Raise ValueError unless every character has voices of its own (no silent fallback)"""
+    known = {character for character, _ in registry}
+    missing = sorted(set(characters) - known)
+    if missing:
+        raise ValueError(f"No TTS voices configured for characters: {missing}")
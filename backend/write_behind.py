@@ -0,0 +1,287 @@
+import os
+import json
+import uuid
+import fcntl
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from sessions import conversation_ref, messages_ref
+
+# Turns waiting to be written; enqueue waits up to WRITE_QUEUE_TIMEOUT for room before the
+# turn goes to the overflow, which is still read but only written once the queue has room
+WRITE_QUEUE_MAX = int(os.getenv('WRITE_QUEUE_MAX', '1000'))
+WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', '2'))
+# Each turn is two writes (the message and the conversation's last_active); Firestore allows 500
+WRITE_BATCH_TURNS = 200
+# How long the writer waits for more turns before committing a partial batch
+WRITE_LINGER_SECONDS = float(os.getenv('WRITE_LINGER_SECONDS', '0.05'))
+WRITE_RETRY_BASE_SECONDS = 0.5
+WRITE_RETRY_MAX_SECONDS = 30
+# Each process appends accepted and committed turns to its own journal in this directory.
+# Journals left by processes that exited are replayed by the next writer to start.
+WRITE_JOURNAL_DIR = os.getenv('WRITE_JOURNAL_DIR', 'cache/turn_journal')
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+def _decode(value):
+    if set(value) == {'$datetime'}:
+        return datetime.fromisoformat(value['$datetime'])
+    return value
+
+def _dump(record):
+    return json.dumps(record, default=_encode, separators=(',', ':')) + '\n'
+
+def _outstanding(journal_path):
+    """The journal's put records whose turns were never committed, in order"""
+    outstanding = OrderedDict()
+    with open(journal_path, 'r', encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                record = json.loads(line, object_hook=_decode)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if record['op'] == 'put':
+                outstanding[record['turn_id']] = record
+            else:
+                for turn_id in record['turn_ids']:
+                    outstanding.pop(turn_id, None)
+    return outstanding
+
+class TurnWriter:
+    """
+    Write-behind persistence of conversation turns.
+
+    enqueue() appends the turn to a local journal and a bounded in-memory
+    queue and returns. A background thread commits queued turns in Firestore
+    batches, retrying failed batches with exponential backoff, and only then
+    drops them from the queue and journals them as committed. When the queue
+    is full enqueue() waits for room, then parks the turn in an overflow that
+    is moved into the queue as commits free it up. Until a turn is committed
+    pending_turns() returns it from either, so reads see their own writes.
+
+    Every writer owns its journal in journal_dir, locked with flock for as long
+    as the process runs, so worker processes and the debug reloader never
+    rewrite each other's journals. At startup a writer takes over the
+    journals of processes that are gone, under their lock, and writes the
+    turns they left.
+
+    discard() drops a cleared conversation's turns that are not written yet,
+    so the clear job that lists the stored ones afterwards finds every turn.
+
+    status() reports the backlog and any ongoing write failure (for /health),
+    so a Firestore outage is visible rather than only delaying turns.
+    """
+
+    def __init__(self, db, journal_dir=WRITE_JOURNAL_DIR, max_pending=WRITE_QUEUE_MAX):
+        self.db = db
+        self.journal_dir = journal_dir
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # turn id -> (conversation id, turn), oldest first
+        self._overflow = OrderedDict()  # Same, for turns waiting for room in _pending
+        self._in_flight = ()  # Turn ids of the batch being committed
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._failed_attempts = 0
+        self._failing_since = None
+        self._last_error = None
+        self._thread = threading.Thread(target=self._run, name='turn-writer', daemon=True)
+        os.makedirs(journal_dir, exist_ok=True)
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal_path = os.path.join(journal_dir, f"{name}.jsonl")
+        self._lock_path = os.path.join(journal_dir, f"{name}.lock")
+        self._lock = open(self._lock_path, 'a')
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def start(self):
+        with self._condition:
+            self._claim_orphans()
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Flush what can be written within timeout; the rest stays in the journal"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        with self._condition:
+            if self._lock.closed:
+                return  # Already stopped
+            self._journal.close()
+            if not self._pending and not self._overflow:
+                # Nothing left for another writer to take over
+                os.remove(self.journal_path)
+                os.remove(self._lock_path)
+            self._lock.close()
+
+    def _append(self, record):
+        # Caller holds the condition's lock. Without the journal turns are still written,
+        # just not recoverable after a crash.
+        try:
+            self._journal.write(_dump(record))
+            self._journal.flush()
+        except (OSError, ValueError) as e:
+            print(f"Error writing the turn journal: {str(e)}")
+
+    def enqueue(self, conversation_id, turn_id, turn):
+        """Accept a turn for writing; it is readable through pending_turns() straight away"""
+        with self._condition:
+            self._append({'op': 'put', 'conversation_id': conversation_id, 'turn_id': turn_id, 'turn': turn})
+            # Backpressure first: a full queue means Firestore is behind or down
+            if self._condition.wait_for(lambda: len(self._pending) < self.max_pending, WRITE_QUEUE_TIMEOUT):
+                self._pending[turn_id] = (conversation_id, turn)
+                self._condition.notify_all()
+            else:
+                print(f"Write queue full; turn {turn_id} waits in the overflow ({len(self._overflow) + 1} turns)")
+                self._overflow[turn_id] = (conversation_id, turn)
+
+    def pending_turns(self, conversation_id):
+        """(turn id, turn) pairs for this conversation that may not be in Firestore yet"""
+        with self._condition:
+            return [(turn_id, turn) for queue in (self._pending, self._overflow)
+                    for turn_id, (pending_id, turn) in queue.items() if pending_id == conversation_id]
+
+    def discard(self, conversation_id, through, timeout=WRITE_RETRY_MAX_SECONDS):
+        """
+        Drop this conversation's turns up to `through` that are not in Firestore
+        yet. A batch already being committed with some of them is waited for
+        (up to timeout), so once this returns every such turn is either stored
+        or gone. Returns the number of turns dropped.
+        """
+        def affected(items):
+            return [turn_id for turn_id, (pending_id, turn) in items
+                    if pending_id == conversation_id and turn['timestamp'] <= through]
+
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: not affected((turn_id, self._pending[turn_id]) for turn_id in self._in_flight
+                                         if turn_id in self._pending), timeout):
+                print(f"Turns of '{conversation_id}' are still being written; the clear may miss them")
+            dropped = affected(list(self._pending.items()) + list(self._overflow.items()))
+            if not dropped:
+                return 0
+            for turn_id in dropped:
+                self._pending.pop(turn_id, None)
+                self._overflow.pop(turn_id, None)
+            self._append({'op': 'done', 'turn_ids': dropped})
+            self._promote()
+            if not self._pending:
+                self._compact()
+            self._condition.notify_all()
+            return len(dropped)
+
+    def status(self):
+        """Backlog size and, while writes are failing, since when and why"""
+        with self._condition:
+            return {
+                "status": "failing" if self._failed_attempts else "ok",
+                "pending": len(self._pending),
+                "overflow": len(self._overflow),
+                "failed_attempts": self._failed_attempts,
+                "failing_since": self._failing_since,
+                "last_error": self._last_error
+            }
+
+    def _promote(self):
+        # Caller holds the condition's lock. Overflowed turns take free room in order.
+        while self._overflow and len(self._pending) < self.max_pending:
+            turn_id, item = self._overflow.popitem(last=False)
+            self._pending[turn_id] = item
+
+    def _claim_orphans(self):
+        # Caller holds the condition's lock. A journal whose lock nobody holds belongs to a
+        # process that exited: copy its outstanding turns into ours, then delete it. The
+        # journal goes before its lock is released, so no other writer claims it twice.
+        claimed = 0
+        for name in sorted(os.listdir(self.journal_dir)):
+            journal_path = os.path.join(self.journal_dir, name)
+            if not name.endswith('.jsonl') or journal_path == self.journal_path:
+                continue
+            lock_path = f"{journal_path[:-len('.jsonl')]}.lock"
+            with open(lock_path, 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Its writer is still running
+                try:
+                    outstanding = _outstanding(journal_path)
+                except FileNotFoundError:
+                    outstanding = None  # Claimed by another writer since the listing
+                if outstanding is not None:
+                    for turn_id, record in outstanding.items():
+                        self._append(record)
+                        self._overflow[turn_id] = (record['conversation_id'], record['turn'])
+                    claimed += len(outstanding)
+                    os.remove(journal_path)
+                os.remove(lock_path)
+        self._promote()
+        if claimed:
+            print(f"Queued {claimed} turns journaled by earlier processes for writing")
+
+    def _compact(self):
+        # Caller holds the condition's lock and every accepted turn is committed,
+        # so nothing in our journal is needed any more
+        try:
+            self._journal.truncate(0)
+        except (OSError, ValueError) as e:
+            print(f"Error compacting the turn journal: {str(e)}")
+
+    def _commit(self, batch_items):
+        batch = self.db.batch()
+        for turn_id, (conversation_id, turn) in batch_items:
+            batch.set(messages_ref(self.db, conversation_id).document(turn_id), turn)
+            # Turns are queued in order, so the last one sets the newest last_active
+            batch.set(conversation_ref(self.db, conversation_id),
+                      {'character': turn['character'], 'last_active': turn['timestamp']}, merge=True)
+        batch.commit()
+
+    def _run(self):
+        attempt = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+                if len(self._pending) < WRITE_BATCH_TURNS and not self._stopping:
+                    # Give turns arriving together a moment to share the commit
+                    self._condition.wait_for(lambda: len(self._pending) >= WRITE_BATCH_TURNS or self._stopping,
+                                             WRITE_LINGER_SECONDS)
+                batch_items = list(self._pending.items())[:WRITE_BATCH_TURNS]
+                self._in_flight = [turn_id for turn_id, _ in batch_items]
+            try:
+                self._commit(batch_items)
+            except Exception as e:
+                with self._condition:
+                    self._in_flight = ()
+                    self._condition.notify_all()
+                attempt += 1
+                delay = min(WRITE_RETRY_MAX_SECONDS, WRITE_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                print(f"Writing {len(batch_items)} turns failed (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+                with self._condition:
+                    self._failed_attempts = attempt
+                    self._failing_since = self._failing_since or datetime.now(timezone.utc)
+                    self._last_error = str(e)
+                    if self._stopping or self._condition.wait_for(lambda: self._stopping,
+                                                                   delay * random.uniform(0.5, 1.0)):
+                        return
+                continue
+            if attempt:
+                print(f"Writing turns succeeded again after {attempt} failed attempts")
+            attempt = 0
+            with self._condition:
+                self._in_flight = ()
+                self._failed_attempts = 0
+                self._failing_since = None
+                self._last_error = None
+                for turn_id, _ in batch_items:
+                    self._pending.pop(turn_id, None)
+                self._append({'op': 'done', 'turn_ids': [turn_id for turn_id, _ in batch_items]})
+                self._promote()
+                if not self._pending:
+                    self._compact()
+                self._condition.notify_all()